@@ -6,11 +6,43 @@ import argparse
 import itertools
 import threading
 
-from fio import run_fio
-from iozone import run_iozone
+from fio import run_fio, run_fio_batch, fio_engines, UnsupportedEngine
+from iozone import run_iozone, run_iozone_batch
+from pyio import run_pyio, run_pyio_batch
+from replay import run_replay, run_replay_batch, replay_benchmarks
+from replay import set_replay_targets
 
-from common import subprocess_executor, get_paramiko_executor
-from common import Results, BenchmarkOption
+from executors import SSHExecutor, connect_all
+from orchestrator import Orchestrator, Barrier
+from compare import compare_main
+from prepare import prepare_all
+from calibration import CalibrationCache, calibrate_all
+from calibration import DEFAULT_CACHE, DEFAULT_TTL
+from deploy import deploy_all, DEFAULT_DEPLOY_DIR
+from sweep import KneeSearch, adaptive_sweep, format_knees
+from sweep import scaling_counts, scaling_sweep, format_scaling
+from resultdb import ResultsDB, RunRecorder, new_run_id, db_main, DEFAULT_DB
+from resultdb import benchmark_key, metrics_to_results
+from common import subprocess_executor, result_engine
+from common import Results, BenchmarkOption, LAT_PERCENTILES
+from stats import merge_histograms, merge_time_series, series_window_mean
+from stats import sum_dev, jain_index, find_stragglers, median, mad
+from timesync import sync_clocks, overlap_window, start_skew, TimedStart
+from telemetry import TelemetrySampler
+from profiler import PROFILER, benchmark_label, format_profile, chrome_trace
+from workloads import load_workloads, workload_benchmarks
+
+
+# binary to run by default, pyio engine is a python script, trace
+# replay is done by fio
+DEFAULT_BINARIES = {'fio': 'fio', 'iozone': 'iozone', 'pyio': 'python',
+                    'replay': 'fio'}
+
+# --log-interval for --sync-start runs, overlap window bw needs time series
+SYNC_LOG_INTERVAL = 1000
+
+# subcommands to work with stored results, see resultdb.db_main
+DB_COMMANDS = ('runs', 'query', 'export', 'reparse')
 
 
 def type_size(string):
@@ -23,10 +55,33 @@ def type_size(string):
 
 def _parse_args(args):
     parser = argparse.ArgumentParser(
-        description="Run set of `fio/iozone` invocations and return result")
+        description="Run set of `fio/iozone/pyio` invocations and " +
+                    "return result")
     parser.add_argument(
         "--iodepth", metavar="IODEPTHS", nargs="+", type=int,
         help="I/O depths to test", default=[8])
+    parser.add_argument(
+        "--ioengine", metavar="ENGINES", nargs="+", default=['libaio'],
+        help="fio io engines to test, engines, which fio on some node " +
+             "doesn't support, are skipped")
+    parser.add_argument(
+        "--engine-opt", metavar="OPTION", action="append", default=[],
+        dest="engine_options",
+        help="fio engine tunable (e.g. hipri, fixedbufs, registerfiles, " +
+             "sqthread_poll=1), passed only to engines, which know it")
+    parser.add_argument(
+        "--concurrency", metavar="JOBS", nargs="+", type=int,
+        help="parallel jobs (fio numjobs/iozone threads) to test",
+        default=[1])
+    parser.add_argument(
+        "--job-files", metavar="PLACEMENT", default='shared',
+        choices=['shared', 'separate', 'offset'],
+        help="fio: jobs use the same file region, separate files or " +
+             "separate regions of the same file/device")
+    parser.add_argument(
+        "--thread", default=False, action="store_true",
+        help="fio: run jobs as threads instead of processes",
+        dest='use_threads')
     parser.add_argument(
         '-a', "--action", metavar="ACTIONS", nargs="+", type=str,
         help="actions to run",
@@ -34,6 +89,16 @@ def _parse_args(args):
     parser.add_argument(
         "--blocksize", metavar="BLOCKSIZE", nargs="+", type=type_size,
         help="single operation block size", default=["512", "4K", "64K"])
+    parser.add_argument(
+        "--workloads", metavar="WORKLOAD_FILE", default=None,
+        help="fio: INI file with named workload profiles, which are run " +
+             "instead of action/blocksize combinations")
+    parser.add_argument(
+        "--workload", metavar="NAMES", nargs="+", default=None,
+        help="run only these workloads of the workload file")
+    parser.add_argument(
+        "--with-product", default=False, action="store_true",
+        help="run action/blocksize combinations along with workloads")
     parser.add_argument(
         "--timeout", metavar="TIMEOUT", type=int,
         help="runtime of a single run", default=None)
@@ -62,114 +127,467 @@ def _parse_args(args):
         "-d", "--direct-io", default=False, action="store_true",
         help="use O_DIRECT", dest='directio')
     parser.add_argument("--bench", metavar="BENCH_TYPE",
-                        choices=['fio', 'iozone'], default='fio')
+                        choices=['fio', 'iozone', 'pyio', 'replay'],
+                        default='fio')
+    parser.add_argument(
+        "--replay-trace", metavar="TRACE_FILE", default=None,
+        help="replay: blktrace (single file, e.g. `blkparse -d`) or fio " +
+             "iolog to replay, offsets are scaled to --iosize")
+    parser.add_argument(
+        "--replay-speed", metavar="FACTORS", nargs="+", type=float,
+        default=[1.0], help="replay: trace timing speedups to test")
+    parser.add_argument(
+        "--replay-no-stall", default=False, action="store_true",
+        help="replay: ignore trace timing, issue io as fast as possible")
+    parser.add_argument(
+        "--replay-node-offset", metavar="SIZE", type=type_size, default=None,
+        help="replay: shift offsets of every next node by this size")
     parser.add_argument("--binpath", metavar="BENCH_BINARY", default=None)
+    parser.add_argument(
+        "--batch", default=False, action="store_true",
+        help="run whole benchmark set as a single fio job file per node")
+    parser.add_argument(
+        "--log-interval", metavar="MSEC", type=int, default=None,
+        help="collect per-interval bw/iops/lat time series (fio only)")
+    parser.add_argument(
+        "--schedule", metavar="SCHEDULE", default='lockstep',
+        choices=Orchestrator.schedules,
+        help="lockstep - nodes start each benchmark together, " +
+             "pipeline - each node runs the set at its own pace")
+    parser.add_argument(
+        "--steadystate", metavar="CRITERION", default=None,
+        help="stop each run once fio steady state criterion is met, " +
+             "e.g. 'bw_slope:0.3%%' or 'iops:5%%'; timeout becomes " +
+             "a max run time")
+    parser.add_argument(
+        "--ss-duration", metavar="SEC", type=int, default=30,
+        help="steady state detection window")
+    parser.add_argument(
+        "--ss-ramp", metavar="SEC", type=int, default=10,
+        help="time to skip before steady state detection starts")
+    parser.add_argument(
+        "--sync-start", metavar="LEAD_SEC", type=float, default=None,
+        help="lockstep mode: start io on all nodes at the same absolute " +
+             "time, LEAD_SEC after all nodes are ready (fio only), " +
+             "enables --log-interval {0}".format(SYNC_LOG_INTERVAL))
+    parser.add_argument(
+        "--straggler-k", metavar="K", type=float, default=3.0,
+        help="node is a straggler if its bw is more than K * MAD " +
+             "below the median")
+    parser.add_argument(
+        "--adaptive", metavar="DIMENSION", default=None,
+        choices=KneeSearch.dimensions,
+        help="instead of running all combinations search for the " +
+             "saturation point over given dimension")
+    parser.add_argument(
+        "--min-gain", metavar="PERCENT", type=float, default=10.0,
+        help="adaptive mode: min throughput gain per value doubling")
+    parser.add_argument(
+        "--max-lat", metavar="USEC", type=float, default=None,
+        help="adaptive mode: p99 latency bound")
+    parser.add_argument(
+        "--max-value", metavar="VALUE", type=int, default=256,
+        help="adaptive mode: max iodepth/concurence value to try")
+    parser.add_argument(
+        "--scaling", metavar="NODES", nargs="*", type=int, default=None,
+        help="run the set on growing subsets of executors: first NODES " +
+             "executors for every given value, powers of two by default")
+    parser.add_argument(
+        "--telemetry", metavar="SEC", type=float, default=None,
+        help="sample node cpu, disk, memory and io pressure counters " +
+             "every SEC seconds during benchmarks")
+    parser.add_argument(
+        "--profile", default=False, action="store_true",
+        help="print time, spent in every phase of the sweep")
+    parser.add_argument(
+        "--trace", metavar="FILE", default=None,
+        help="store phase spans as Chrome trace-event json, " +
+             "implies --profile")
+    parser.add_argument(
+        "--deploy", metavar="LOCAL_BINARY", default=None,
+        help="copy local fio/iozone binary to all nodes and use it, " +
+             "nodes, which already have the same binary, are skipped")
+    parser.add_argument(
+        "--deploy-dir", metavar="DIR", default=DEFAULT_DEPLOY_DIR,
+        help="node directory to keep deployed binaries in")
+    parser.add_argument(
+        "--deploy-workers", metavar="COUNT", type=int, default=8,
+        help="max nodes to copy binary to concurrently")
+    parser.add_argument(
+        "--prepare", default=False, action="store_true",
+        help="lay out and fill target files once for the whole set")
+    parser.add_argument(
+        "--precondition", metavar="MAX_SEC", type=int, default=None,
+        help="prepare phase: run sustained random write till steady " +
+             "state, at most MAX_SEC (fio only)")
+    parser.add_argument(
+        "--force-prepare", default=False, action="store_true",
+        help="prepare phase: ignore marker of already prepared files")
+    parser.add_argument(
+        "--calibration-cache", metavar="PATH", default=DEFAULT_CACHE,
+        help="iozone: file to keep timeout calibration results in")
+    parser.add_argument(
+        "--calibration-ttl", metavar="SEC", type=int, default=DEFAULT_TTL,
+        help="iozone: max age of cached calibration results")
+    parser.add_argument(
+        "--recalibrate", default=False, action="store_true",
+        help="iozone: drop cached calibration results")
+    parser.add_argument(
+        "--db", metavar="DB_PATH", default=DEFAULT_DB,
+        help="database to store raw results into")
+    parser.add_argument(
+        "--resume", metavar="RUN_ID", default=None,
+        help="continue stored sweep, skipping benchmarks, which already " +
+             "have results on all nodes")
 
     return parser.parse_args(args)
 
 
-def run_benchmark_th(res_q, executor, benchmark, filename, timeout,
-                     bench_param, sync_obj):
-    try:
-        bench_type, bin_path = bench_param
-        if bench_type == 'fio':
-            res = run_fio(executor, benchmark, filename, timeout, bin_path,
-                          sync_obj=sync_obj)
-        elif bench_type == 'iozone':
-            res = run_iozone(executor, benchmark, filename, timeout, bin_path,
-                             sync_obj=sync_obj)
-
-        res.parameters = benchmark.__dict__
-        res.type = benchmark.action
-        res.block_size = benchmark.blocksize
-        res.concurence = benchmark.concurence
-        res.iodepth = benchmark.iodepth
+def set_bench_params(res, benchmark, executor, bench_type):
+    res.node = executor.node
+    res.parameters = benchmark.__dict__
+    res.type = benchmark.label
+    res.block_size = benchmark.blocksize
+    res.concurence = benchmark.concurence
+    res.iodepth = benchmark.iodepth
+    res.ioengine = result_engine(bench_type, benchmark.ioengine)
 
-    except:
-        import traceback
-        traceback.print_exc()
-        res = None
+
+def start_telemetry(executor, benchmark):
+    if benchmark.telemetry_interval is None:
+        return None
+    sampler = TelemetrySampler(executor, benchmark.telemetry_interval)
+    sampler.start()
+    return sampler
+
+
+def stop_telemetry(sampler):
+    if sampler is not None:
+        sampler.stop()
+
+
+def set_telemetry(res, sampler, start_time, end_time):
+    "summarizes telemetry for io window, or for the whole run if unknown"
+    if sampler is None:
+        return
+
+    if res.start_time is not None:
+        start_time, end_time = res.start_time, res.end_time
+    res.telemetry = sampler.summarize(start_time, end_time)
+
+
+def add_io_span(res, label=None):
+    "records io interval, reported by the benchmark, if any"
+    if res.start_time is not None:
+        PROFILER.add('io', res.start_time, res.end_time, benchmark=label)
+
+
+def run_benchmark(executor, filename, benchmark, timeout, bench_param,
+                  sync_obj, recorder=None):
+    bench_type, bin_path = bench_param
+    label = benchmark_label(benchmark, bench_type)
+    with PROFILER.bind(executor.node, label), PROFILER.span('benchmark'):
+        try:
+            sampler = start_telemetry(executor, benchmark)
+            start_time = time.time()
+            try:
+                if bench_type == 'fio':
+                    res = run_fio(executor, benchmark, filename, timeout,
+                                  bin_path, sync_obj=sync_obj)
+                elif bench_type == 'iozone':
+                    res = run_iozone(executor, benchmark, filename, timeout,
+                                     bin_path, sync_obj=sync_obj)
+                elif bench_type == 'pyio':
+                    res = run_pyio(executor, benchmark, filename, timeout,
+                                   bin_path, sync_obj=sync_obj)
+                elif bench_type == 'replay':
+                    res = run_replay(executor, benchmark, filename, timeout,
+                                     bin_path, sync_obj=sync_obj)
+            finally:
+                stop_telemetry(sampler)
+
+            set_bench_params(res, benchmark, executor, bench_type)
+            set_telemetry(res, sampler, start_time, time.time())
+            add_io_span(res)
+
+            if recorder is not None:
+                with PROFILER.span('store'):
+                    recorder.record(executor, benchmark, res, start_time,
+                                    time.time())
+
+        except UnsupportedEngine as exc:
+            print "Skip benchmark:", exc
+            res = None
+        except:
+            import traceback
+            traceback.print_exc()
+            res = None
+        finally:
+            # failed node must not block others at the barrier
+            if sync_obj is not None:
+                sync_obj.release()
+    return res
+
+
+def run_benchmark_batch_th(res_q, executor, benchmarks, filename, timeout,
+                           bench_param, sync_obj, recorder=None):
+    with PROFILER.bind(executor.node, 'batch'), \
+            PROFILER.span('benchmark'):
+        try:
+            bench_type, bin_path = bench_param
+
+            sampler = start_telemetry(executor, benchmarks[0])
+            start_time = time.time()
+            try:
+                if bench_type == 'fio':
+                    res = run_fio_batch(executor, benchmarks, filename,
+                                        timeout, bin_path, sync_obj=sync_obj)
+                elif bench_type == 'iozone':
+                    res = run_iozone_batch(executor, benchmarks, filename,
+                                           timeout, bin_path,
+                                           sync_obj=sync_obj)
+                elif bench_type == 'pyio':
+                    res = run_pyio_batch(executor, benchmarks, filename,
+                                         timeout, bin_path,
+                                         sync_obj=sync_obj)
+                elif bench_type == 'replay':
+                    res = run_replay_batch(executor, benchmarks, filename,
+                                           timeout, bin_path,
+                                           sync_obj=sync_obj)
+            finally:
+                stop_telemetry(sampler)
+            end_time = time.time()
+
+            for bench_res, benchmark in zip(res, benchmarks):
+                set_bench_params(bench_res, benchmark, executor,
+                                 bench_type)
+                set_telemetry(bench_res, sampler, start_time, end_time)
+                add_io_span(bench_res, benchmark_label(benchmark,
+                                                       bench_type))
+                if recorder is not None:
+                    with PROFILER.span('store'):
+                        recorder.record(executor, benchmark, bench_res,
+                                        start_time, end_time)
+
+        except:
+            import traceback
+            traceback.print_exc()
+            res = None
+        finally:
+            sync_obj.release()
     res_q.put((executor, res))
 
 
-class Barrier(object):
-    def __init__(self, counter):
-        self.counter = counter
-        self.c_lock = threading.Lock()
-        self.ready_loc = threading.Lock()
-        self.ready_loc.acquire()
+def add_node_result(result, th_res):
+    """Merges results of a single node into cluster-wide result
+
+    Node results are kept in `result.node_results`.
+    """
+
+    if result.block_size is None:
+        result.type = th_res.type
+        result.block_size = th_res.block_size
+        result.concurence = th_res.concurence
+        result.iodepth = th_res.iodepth
+        result.ioengine = th_res.ioengine
+        result.bw_mean = th_res.bw_mean
+        result.bw_max = th_res.bw_max
+        result.bw_min = th_res.bw_min
+        result.bw_dev = th_res.bw_dev
+        result.iops = th_res.iops
+        result.clat_hist = th_res.clat_hist
+        result.time_series = th_res.time_series
+        result.converged = th_res.converged
+        result.node_times = []
+        result.node_results = [th_res]
+    else:
+        assert result.type == th_res.type
+        assert result.block_size == th_res.block_size
+        assert result.concurence == th_res.concurence
+        assert result.iodepth == th_res.iodepth
+        assert result.ioengine == th_res.ioengine
+
+        result.node_results.append(th_res)
+
+        # cluster throughput is a sum of node throughputs
+        result.bw_mean += th_res.bw_mean
+        result.bw_dev = sum_dev(res.bw_dev for res in result.node_results)
+
+        result.bw_max = max(result.bw_max, th_res.bw_max)
+        result.bw_min = min(result.bw_min, th_res.bw_min)
+
+        if result.iops is not None and th_res.iops is not None:
+            result.iops += th_res.iops
+        else:
+            result.iops = None
+
+        if result.clat_hist is not None and th_res.clat_hist is not None:
+            result.clat_hist = merge_histograms(result.clat_hist,
+                                                th_res.clat_hist)
+        else:
+            result.clat_hist = None
+
+        result.time_series = merge_time_series(result.time_series,
+                                               th_res.time_series)
+
+        # cluster converged only if every node did
+        if result.converged is not None:
+            result.converged = result.converged and bool(th_res.converged)
+
+    # percentiles can't be averaged, so recalculate them from histogram
+    if result.clat_hist is not None:
+        result.update_lat_percentiles()
+
+    result.jain_index = jain_index(res.bw_mean
+                                   for res in result.node_results)
+
+    if result.node_times is not None:
+        if th_res.start_time is not None:
+            result.node_times.append((th_res.node, th_res.start_time,
+                                      th_res.end_time))
+            update_overlap(result)
+        else:
+            result.node_times = None
 
-    def wait(self):
-        with self.c_lock:
-            self.counter -= 1
-            if self.counter == 0:
-                self.ready_loc.release()
-        self.ready_loc.acquire()
-        self.ready_loc.release()
 
+def update_overlap(result):
+    "calculates cluster aggregates for interval when all nodes were active"
+    result.skew = start_skew(result.node_times)
+    result.overlap = overlap_window(result.node_times)
+    result.bw_overlap = None
 
-def run_benchmark_set(executors, benchmark_set, bench_type, timeout=30):
+    if result.overlap is not None and result.time_series is not None:
+        start, end = result.overlap
+        result.bw_overlap = series_window_mean(result.time_series,
+                                               start * 1000, end * 1000)
+
+
+def print_node_result(stime, executor, th_res):
+    print "At +", int(time.time() - stime), "sec ",
+    print "get res from", executor.node,
+    print "{0}~{1}".format(int(th_res.bw_mean), int(th_res.bw_dev))
+
+
+def run_benchmark_set(executors, benchmark_set, bench_type, timeout=30,
+                      schedule='lockstep', recorder=None, start_lead=None):
     """Runs a set of benchmarks and returns `fio/iozone` provided results.
 
+    Every node gets a single worker for the whole set, see
+    `orchestrator.Orchestrator` for `schedule` description.
+
     :param benchmark_set: an iterable that returns `BenchmarkOption` instances
+    :param recorder: `resultdb.RunRecorder` to store node results into
+    :param start_lead: if set, in lockstep mode nodes agree on absolute io
+                       start time, `start_lead` seconds after all are ready
     """
 
-    # TODO(pboldin): prepare a jobs file to feed to fio and invoke
-    #                it only once
-
-    for benchmark in benchmark_set:
-        q = Queue.Queue()
-        threads = []
-        stime = time.time()
+    def run_func(executor, filename, benchmark, sync_obj):
+        return run_benchmark(executor, filename, benchmark, timeout,
+                             bench_type, sync_obj, recorder)
 
-        sync_obj = Barrier(len(executors))
-
-        for (executor, filename) in executors:
-            params = (q, executor, benchmark, filename, timeout, bench_type,
-                      sync_obj)
-            th = threading.Thread(None, run_benchmark_th, None, params)
-            th.daemon = True
-            threads.append(th)
-            th.start()
+    stime = time.time()
+    if start_lead is not None:
+        orchestrator = Orchestrator(executors, run_func,
+                                    lambda count: TimedStart(count,
+                                                             start_lead))
+    else:
+        orchestrator = Orchestrator(executors, run_func)
 
+    for node_results in orchestrator.run(benchmark_set, schedule):
         result = Results()
-        for count, th in enumerate(threads):
-            executor, th_res = q.get()
-
+        for executor, th_res in node_results:
             if th_res is not None:
-                print "At +", int(time.time() - stime), "sec ",
-                print "get res from", executor.node,
-                print "{0}~{1}".format(int(th_res.bw_mean), int(th_res.bw_dev))
-
-                if result.block_size is None:
-                    result.type = th_res.type
-                    result.block_size = th_res.block_size
-                    result.concurence = th_res.concurence
-                    result.iodepth = th_res.iodepth
-                    result.bw_mean = th_res.bw_mean
-                    result.bw_max = th_res.bw_max
-                    result.bw_min = th_res.bw_min
-                    result.bw_dev = th_res.bw_dev
-                else:
-                    assert result.type == th_res.type
-                    assert result.block_size == th_res.block_size
-                    assert result.concurence == th_res.concurence
-                    assert result.iodepth == th_res.iodepth
-
-                    # ????
-                    result.bw_mean += th_res.bw_mean
-
-                    result.bw_max = max(result.bw_max, th_res.bw_max)
-                    result.bw_min = min(result.bw_min, th_res.bw_min)
-
-                    sq_dev = (result.bw_dev ** 2 * count + th_res.bw_dev ** 2)
-                    result.bw_dev = (sq_dev / (count + 1)) ** 0.5
+                print_node_result(stime, executor, th_res)
+                add_node_result(result, th_res)
             else:
                 print "Node", executor.node, "fails to execute", bench_type
 
-        for th in threads:
-            th.join()
+        yield result
+
 
+def run_benchmark_set_batched(executors, benchmark_set, bench_type,
+                              timeout=30, recorder=None):
+    """Runs a set of benchmarks with a single `fio` invocation per node.
+
+    Every node gets one job file with all benchmarks as `stonewall`ed jobs.
+    `iozone` runs as few invocations as possible, see `run_iozone_batch`.
+    Returns the same per-benchmark results as `run_benchmark_set`.
+
+    :param benchmark_set: an iterable that returns `BenchmarkOption` instances
+    """
+
+    benchmark_set = list(benchmark_set)
+    q = Queue.Queue()
+    threads = []
+    stime = time.time()
+
+    sync_obj = Barrier(len(executors))
+
+    for (executor, filename) in executors:
+        params = (q, executor, benchmark_set, filename, timeout, bench_type,
+                  sync_obj, recorder)
+        th = threading.Thread(None, run_benchmark_batch_th, None, params)
+        th.daemon = True
+        threads.append(th)
+        th.start()
+
+    results = [Results() for _ in benchmark_set]
+    for th in threads:
+        executor, th_res = q.get()
+
+        if th_res is not None:
+            for result, bench_res in zip(results, th_res):
+                print_node_result(stime, executor, bench_res)
+                add_node_result(result, bench_res)
+        else:
+            print "Node", executor.node, "fails to execute", bench_type
+
+    for th in threads:
+        th.join()
+
+    return results
+
+
+def resume_benchmark_set(run_set, executors, benchmark_set, done):
+    """Runs only benchmarks, which has no stored results on some node
+
+    Results of completed benchmarks are rebuilt from stored node results,
+    so the whole set is returned in the original order.
+
+    :param run_set: function, which runs a benchmark set on executors
+    :param done: stored results, see `resultdb.ResultsDB.completed`
+    """
+    # several executors may share a node (e.g. local ones)
+    nodes = {}
+    for executor, _ in executors:
+        nodes[executor.node] = nodes.get(executor.node, 0) + 1
+
+    stored = []
+    pending = []
+    for bench in benchmark_set:
+        node_rows = done.get(benchmark_key(bench.__dict__), {})
+        if all(len(node_rows.get(node, [])) >= count
+               for node, count in nodes.items()):
+            stored.append([row for node, count in sorted(nodes.items())
+                           for row in node_rows[node][-count:]])
+        else:
+            stored.append(None)
+            pending.append(bench)
+
+    print "Resume:", len(benchmark_set) - len(pending), "of",
+    print len(benchmark_set), "benchmarks are already done"
+
+    pending_results = iter(run_set(executors, pending) if pending else [])
+    for rows in stored:
+        if rows is None:
+            yield next(pending_results)
+            continue
+
+        result = Results()
+        for row in rows:
+            th_res = metrics_to_results(row)
+            th_res.node = row['node']
+            add_node_result(result, th_res)
         yield result
 
 
@@ -181,18 +599,139 @@ def create_executor(uri, key_file):
         user_password, host_path = params.split("@", 1)
         host, path = host_path.split(":", 1)
         user, password = user_password.split(":", 1)
-        return (get_paramiko_executor(host, user, password, key_file), path)
+        return (SSHExecutor(host, user, password, key_file), path)
     else:
         raise ValueError("Can't instantiate executor from {!r}".format(uri))
 
 
+def format_value(val):
+    if val is None:
+        return "-"
+    return str(int(val))
+
+
+def format_time_series(res):
+    series = res.time_series
+    yield "# {0} {1} {2} {3} time series, {4} ms interval".format(
+        res.type, res.block_size, res.concurence, res.iodepth,
+        series.interval)
+    yield "# time_sec BW IOPS LATus"
+
+    if len(series) == 0:
+        return
+
+    start = series.time[0]
+    for tm, bw, iops, lat in series.rows():
+        yield "{0:.3f} {1} {2} {3}".format((tm - start) / 1000.0,
+                                           int(bw), int(iops), int(lat))
+
+
+def format_node_breakdown(res, straggler_k):
+    node_bws = [(node_res.node, node_res.bw_mean)
+                for node_res in res.node_results]
+    bws = [bw for _, bw in node_bws]
+    stragglers = find_stragglers(node_bws, straggler_k)
+
+    yield "# {0} {1} {2} {3} per node bw: min={4} median={5} max={6} " \
+          "MAD={7} jain={8:.3f} stragglers: {9}".format(
+              res.type, res.block_size, res.concurence, res.iodepth,
+              int(min(bws)), int(median(bws)), int(max(bws)), int(mad(bws)),
+              res.jain_index, " ".join(stragglers) or "-")
+
+    for node_res in res.node_results:
+        line = "#     {0} {1}".format(node_res.node, int(node_res.bw_mean))
+        if node_res.node in stragglers:
+            line += " STRAGGLER"
+        if node_res.job_results:
+            line += " jobs: " + " ".join(str(int(job.bw_mean))
+                                         for job in node_res.job_results)
+        yield line
+
+
+def format_node_times(res):
+    if res.overlap is None:
+        overlap = "no overlap"
+    else:
+        overlap = "overlap {0:.1f}s".format(res.overlap[1] - res.overlap[0])
+
+    # without time series only full run bw is known
+    if res.overlap is not None and res.bw_overlap is None:
+        overlap += " (bw isn't limited to it)"
+
+    skew = " ".join("{0}=+{1}ms".format(node, int(skew * 1000))
+                    for node, skew in res.skew)
+    yield "# {0} {1} {2} {3} {4}, start skew: {5}".format(
+        res.type, res.block_size, res.concurence, res.iodepth, overlap, skew)
+
+
+def format_telemetry(res):
+    for th_res in res.node_results:
+        tel = th_res.telemetry
+        if tel is None:
+            continue
+
+        yield ("# {0} {1} {2} {3} {4} dev={5} util={6}% await={7}ms " +
+               "iowait={8}% sys={9}% steal={10}% io_pressure={11}% " +
+               "mem_avail={12}MiB").format(
+            res.type, res.block_size, res.concurence, res.iodepth,
+            th_res.node, tel['device'],
+            format_value(tel['util']),
+            "-" if tel['await'] is None else "{0:.1f}".format(tel['await']),
+            *[format_value(tel[name])
+              for name in ('iowait', 'sys', 'steal', 'io_pressure',
+                           'mem_avail_mb')])
+
+
+def format_ratio(val):
+    if val is None:
+        return "-"
+    return "{0:.0f}%".format(val * 100)
+
+
+def format_replay(res):
+    "replay achievements against the original trace timing"
+    for th_res in res.node_results:
+        cmp = th_res.replay
+        if cmp is None:
+            continue
+
+        yield ("# {0} {1} {2} {3} bw={4} ({5} of trace {6}) iops={7} " +
+               "({8} of trace {9}) time={10}s (trace {11}s, lag {12}s) " +
+               "done={13}% p99={14}us").format(
+            res.type, res.iodepth, th_res.node, res.ioengine,
+            format_value(th_res.bw_mean), format_ratio(cmp['bw_ratio']),
+            format_value(cmp['trace_bw']),
+            format_value(th_res.iops), format_ratio(cmp['iops_ratio']),
+            format_value(cmp['trace_iops']),
+            "{0:.1f}".format(cmp['duration']),
+            "-" if cmp['trace_duration'] is None else
+            "{0:.1f}".format(cmp['trace_duration']),
+            "-" if cmp['lag'] is None else "{0:+.1f}".format(cmp['lag']),
+            format_value(cmp['done']), format_value(th_res.lat_p99))
+
+
+def format_converged(converged):
+    if converged is None:
+        return "-"
+    return "yes" if converged else "no"
+
+
 def format_results(args_obj, results):
+    # engine column is shown only if engines are compared
+    show_engine = len(args_obj.ioengine) > 1
+
+    fields = 'Type BlockSize Concurence Iodepth'.split()
+    if show_engine:
+        fields.append('Engine')
+    fields += 'BW_MEAN~BW_DEV IOPS'.split()
+    fields += 'P50us P99us P99.9us P99.99us Converged'.split()
+    fields += 'BW_OVERLAP MaxSkewMs Jain'.split()
+
     if args_obj.format == 'table':
         try:
             import texttable
             table = texttable.Texttable()
             table.set_deco(texttable.Texttable.HEADER)
-            fields = 'Type BlockSize Concurence Iodepth BW_MEAN~BW_DEV'.split()
             table.set_cols_align(["l"] * len(fields))
             table.add_row(fields)
         except ImportError:
@@ -201,24 +740,100 @@ def format_results(args_obj, results):
     else:
         table = None
 
+    time_series = []
+    node_times = []
+    breakdowns = []
     for res in results:
+        if res.node_results:
+            breakdowns.append(res)
+        if res.time_series is not None:
+            time_series.append(res)
+        if res.node_times:
+            node_times.append(res)
+
+        row = [res.type, res.block_size, res.concurence, res.iodepth]
+        if show_engine:
+            row.append(res.ioengine or "-")
+        row += ["{0}~{1}".format(int(res.bw_mean), int(res.bw_dev)),
+                format_value(res.iops)]
+        row += [format_value(getattr(res, attr))
+                for attr, _ in LAT_PERCENTILES]
+        row.append(format_converged(res.converged))
+        row.append(format_value(res.bw_overlap))
+        if res.skew:
+            row.append(format_value(max(skew for _, skew in res.skew) * 1000))
+        else:
+            row.append("-")
+
+        if res.jain_index is None:
+            row.append("-")
+        else:
+            row.append("{0:.3f}".format(res.jain_index))
+
         if table is not None:
-            table.add_row([
-                res.type, res.block_size, res.concurence,
-                res.iodepth, "{0}~{1}".format(int(res.bw_mean),
-                                              int(res.bw_dev))])
+            table.add_row(row)
         else:
-            res_string = "{0} {1} {2} {3} {4}~{5}".format(res.type,
-                                                          res.block_size,
-                                                          res.concurence,
-                                                          res.iodepth,
-                                                          int(res.bw_mean),
-                                                          int(res.bw_dev))
-            yield res_string
+            yield " ".join(map(str, row))
 
     if table is not None:
         yield table.draw()
 
+    for res in time_series:
+        yield ""
+        for line in format_time_series(res):
+            yield line
+
+    if breakdowns:
+        yield ""
+    for res in breakdowns:
+        for line in format_node_breakdown(res, args_obj.straggler_k):
+            yield line
+
+    if node_times:
+        yield ""
+    for res in node_times:
+        for line in format_node_times(res):
+            yield line
+
+    telemetry = [res for res in breakdowns
+                 if any(th_res.telemetry is not None
+                        for th_res in res.node_results)]
+    if telemetry:
+        yield ""
+    for res in telemetry:
+        for line in format_telemetry(res):
+            yield line
+
+    replays = [res for res in breakdowns
+               if any(th_res.replay is not None
+                      for th_res in res.node_results)]
+    if replays:
+        yield ""
+    for res in replays:
+        for line in format_replay(res):
+            yield line
+
+
+def supported_benchmarks(executors, benchmark_set, fio_path):
+    "drops benchmarks with io engines, which fio on some node doesn't know"
+    unsupported = set()
+    for executor, _ in executors:
+        engines = fio_engines(executor, fio_path)
+        if engines is None:
+            continue
+        for bench in benchmark_set:
+            if bench.ioengine not in engines:
+                unsupported.add(bench.ioengine)
+                print "fio on", executor.node, "doesn't support",
+                print bench.ioengine, "engine"
+
+    if unsupported:
+        print "Skip benchmarks with", ", ".join(sorted(unsupported)),
+        print "engine(s)"
+
+    return [bench for bench in benchmark_set
+            if bench.ioengine not in unsupported]
+
 
 def ssize_to_kb(ssize):
     try:
@@ -237,22 +852,85 @@ def ssize_to_kb(ssize):
         raise ValueError(tmpl.format(ssize))
 
 
-def do_main(args_obj):
-    args_obj.blocksize = map(ssize_to_kb, args_obj.blocksize)
+def load_benchmark_workloads(args_obj):
+    if args_obj.bench != 'fio':
+        raise ValueError("Workload profiles are supported by fio only")
+
+    workloads = load_workloads(args_obj.workloads)
+    if args_obj.workload is not None:
+        known = set(name for name, _ in workloads)
+        unknown = set(args_obj.workload) - known
+        if unknown:
+            raise ValueError("No workload(s) {0} in {1}".format(
+                ", ".join(sorted(unknown)), args_obj.workloads))
+        workloads = [(name, options) for name, options in workloads
+                     if name in args_obj.workload]
+
+    benchmarks = []
+    for ioengine in args_obj.ioengine:
+        for bench in workload_benchmarks(workloads, args_obj.concurrency,
+                                         args_obj.iodepth, args_obj.iosize):
+            bench.ioengine = ioengine
+            benchmarks.append(bench)
+    return benchmarks
+
+
+def load_replay_benchmarks(args_obj):
+    if args_obj.replay_trace is None:
+        raise ValueError("Trace replay requires --replay-trace")
 
+    node_offset = None
+    if args_obj.replay_node_offset is not None:
+        node_offset = ssize_to_kb(args_obj.replay_node_offset)
+
+    benchmarks = []
+    for ioengine in args_obj.ioengine:
+        for bench in replay_benchmarks(args_obj.replay_trace,
+                                       args_obj.iodepth,
+                                       args_obj.replay_speed,
+                                       args_obj.iosize,
+                                       args_obj.replay_no_stall,
+                                       node_offset):
+            bench.ioengine = ioengine
+            benchmarks.append(bench)
+    return benchmarks
+
+
+def do_main(args_obj):
     if args_obj.iosize is not None:
         args_obj.iosize = ssize_to_kb(args_obj.iosize)
 
-    params = ([1], args_obj.iodepth, args_obj.action,
-              args_obj.blocksize, [args_obj.iosize])
-    all_combinations = itertools.product(*params)
+    if args_obj.sync_start is not None and args_obj.log_interval is None:
+        args_obj.log_interval = SYNC_LOG_INTERVAL
+
+    benchmark_set = []
+    if args_obj.bench == 'replay':
+        benchmark_set = load_replay_benchmarks(args_obj)
+    elif args_obj.workloads is None or args_obj.with_product:
+        args_obj.blocksize = map(ssize_to_kb, args_obj.blocksize)
+        params = (args_obj.concurrency, args_obj.iodepth, args_obj.action,
+                  args_obj.blocksize, [args_obj.iosize])
+        all_combinations = itertools.product(args_obj.ioengine, *params)
+
+        for product in all_combinations:
+            bench = BenchmarkOption(*product[1:])
+            bench.ioengine = product[0]
+            benchmark_set.append(bench)
 
-    benchmark_set = [BenchmarkOption(*product)
-                     for product in all_combinations]
+    if args_obj.workloads is not None and args_obj.bench != 'replay':
+        benchmark_set.extend(load_benchmark_workloads(args_obj))
 
     for bench in benchmark_set:
+        bench.engine_options = args_obj.engine_options
         bench.direct_io = args_obj.directio
         bench.sync = args_obj.sync
+        bench.log_interval = args_obj.log_interval
+        bench.use_threads = args_obj.use_threads
+        bench.job_files = args_obj.job_files
+        bench.steadystate = args_obj.steadystate
+        bench.ss_duration = args_obj.ss_duration
+        bench.ss_ramp = args_obj.ss_ramp
+        bench.telemetry_interval = args_obj.telemetry
 
     timeout = args_obj.timeout
 
@@ -262,29 +940,144 @@ def do_main(args_obj):
             print "timeout option will be ignored."
         timeout = args_obj.total_time / len(benchmark_set)
 
+    if args_obj.profile or args_obj.trace:
+        PROFILER.enable()
+
     executors = [create_executor(uri, args_obj.keyfile)
                  for uri in args_obj.executors]
+    connect_all([executor for executor, _ in executors])
+    if args_obj.bench == 'replay':
+        set_replay_targets(benchmark_set, executors)
+    with PROFILER.span('clock_sync'):
+        sync_clocks([executor for executor, _ in executors])
+
+    if args_obj.deploy is not None:
+        with PROFILER.span('deploy'):
+            args_obj.binpath = deploy_all(
+                [executor for executor, _ in executors], args_obj.deploy,
+                args_obj.deploy_dir, args_obj.deploy_workers)
 
     bench_type_path = (args_obj.bench,
                        args_obj.binpath
                        if args_obj.binpath is not None
-                       else args_obj.bench)
+                       else DEFAULT_BINARIES[args_obj.bench])
+
+    if args_obj.bench in ('fio', 'replay'):
+        benchmark_set = supported_benchmarks(executors, benchmark_set,
+                                             bench_type_path[1])
 
-    result = run_benchmark_set(executors,
-                               benchmark_set,
-                               bench_type_path,
-                               timeout=timeout)
+    if args_obj.prepare:
+        with PROFILER.span('prepare'):
+            prepare_all(executors, benchmark_set, bench_type_path,
+                        precondition=args_obj.precondition,
+                        force=args_obj.force_prepare)
+
+    if args_obj.bench == 'iozone' and timeout is not None:
+        cache = CalibrationCache(args_obj.calibration_cache,
+                                 args_obj.calibration_ttl)
+        if args_obj.recalibrate:
+            cache.invalidate()
+        with PROFILER.span('calibrate'):
+            calibrate_all(executors, benchmark_set, timeout,
+                          bench_type_path[1], cache)
+
+    db = ResultsDB(args_obj.db)
+    if args_obj.resume is not None:
+        if args_obj.adaptive or args_obj.scaling is not None:
+            raise ValueError("Can't resume adaptive or scaling sweep")
+        run_id = args_obj.resume
+        if run_id not in [sweep[0] for sweep in db.sweeps()]:
+            raise ValueError("Unknown run id {0!r}".format(run_id))
+        done = db.completed(run_id)
+    else:
+        run_id = new_run_id()
+        db.add_sweep(run_id, args_obj.__dict__)
+    recorder = RunRecorder(db, run_id, args_obj.bench)
+    print "Run id", run_id, "results are stored into", args_obj.db
+
+    def run_set(executors, benchmark_set):
+        if args_obj.batch:
+            return run_benchmark_set_batched(executors,
+                                             benchmark_set,
+                                             bench_type_path,
+                                             timeout=timeout,
+                                             recorder=recorder)
+        return run_benchmark_set(executors,
+                                 benchmark_set,
+                                 bench_type_path,
+                                 timeout=timeout,
+                                 schedule=args_obj.schedule,
+                                 recorder=recorder,
+                                 start_lead=args_obj.sync_start)
+
+    knees = []
+    scaling = []
+    if args_obj.adaptive:
+        def run_point(benchmark):
+            return list(run_set(executors, [benchmark]))[0]
+
+        # one template per combination of all other parameters
+        templates = []
+        known_templates = set()
+        for bench in benchmark_set:
+            setattr(bench, args_obj.adaptive, 1)
+            key = benchmark_key(bench.__dict__)
+            if key not in known_templates:
+                known_templates.add(key)
+                templates.append(bench)
+
+        result = adaptive_sweep(run_point, templates, knees,
+                                dimension=args_obj.adaptive,
+                                min_gain=args_obj.min_gain,
+                                max_lat=args_obj.max_lat,
+                                max_value=args_obj.max_value)
+    elif args_obj.scaling is not None:
+        counts = scaling_counts(len(executors), args_obj.scaling)
+        result = scaling_sweep(lambda execs: run_set(execs, benchmark_set),
+                               executors, counts, scaling)
+    elif args_obj.resume is not None:
+        result = resume_benchmark_set(run_set, executors, benchmark_set, done)
+    else:
+        result = run_set(executors, benchmark_set)
 
     params = ["{0!s}={1!r}".format(k, v) for k, v in args_obj.__dict__.items()]
     args_obj.output.write(" ".join(params) + "\n\n")
 
+    # plain rows are written as soon as benchmarks are done
     for line in format_results(args_obj, result):
         args_obj.output.write(line + "\n")
+        args_obj.output.flush()
+
+    if knees:
+        args_obj.output.write("\n")
+        for line in format_knees(knees, args_obj.adaptive):
+            args_obj.output.write(line + "\n")
 
+    if scaling:
+        args_obj.output.write("\n")
+        for line in format_scaling(scaling):
+            args_obj.output.write(line + "\n")
+
+    if PROFILER.enabled:
+        args_obj.output.write("\n")
+        for line in format_profile(PROFILER):
+            args_obj.output.write(line + "\n")
+
+    if args_obj.trace:
+        with open(args_obj.trace, "w") as fd:
+            fd.write(chrome_trace(PROFILER))
+
+    db.close()
     return 0
 
 
 def main(args):
+    if len(args) > 0 and args[0] in DB_COMMANDS:
+        return db_main(args)
+
+    if len(args) > 0 and args[0] == 'compare':
+        return compare_main(args[1:])
+
     args_obj = _parse_args(args)
     return do_main(args_obj)
 
@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import threading
+
+from orchestrator import Barrier
+from iozone import calibrated_size
+
+
+DEFAULT_CACHE = "iozone_calibration.json"
+
+# calibrated sizes are trusted for a day by default
+DEFAULT_TTL = 24 * 3600
+
+
+def action_class(action):
+    "calibration differs only between reading and writing"
+    return 'read' if 'read' in action else 'write'
+
+
+class CalibrationCache(object):
+    """Persistent cache of iozone file sizes, which fill a timeout
+
+    Entries are keyed by node, target, block size, action class and
+    direct/sync flags and are kept in a json file between runs. Entries
+    older than `ttl` seconds are ignored.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+
+        if path is not None and os.path.exists(path):
+            with open(path) as fd:
+                self.entries = json.load(fd)
+
+    @staticmethod
+    def key(node, filename, params):
+        return "{0}|{1}|{2}|{3}|direct={4}|sync={5}".format(
+            node, filename, params.blocksize, action_class(params.action),
+            int(bool(params.direct_io)), int(bool(params.sync)))
+
+    def get(self, key, timeout):
+        with self.lock:
+            entry = self.entries.get(key)
+
+        if entry is None or entry['timeout'] != timeout:
+            return None
+
+        if self.ttl is not None and time.time() - entry['time'] > self.ttl:
+            return None
+
+        return entry['size']
+
+    def set(self, key, timeout, size):
+        with self.lock:
+            self.entries[key] = {'timeout': timeout,
+                                 'size': size,
+                                 'time': time.time()}
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+
+    def save(self):
+        if self.path is None:
+            return
+
+        with self.lock:
+            data = json.dumps(self.entries, indent=1, sort_keys=True)
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as fd:
+            fd.write(data)
+        os.rename(tmp_path, self.path)
+
+
+def calibrate_all(executors, benchmarks, timeout, iozone_path, cache):
+    """Calibrates all nodes concurrently, once per distinct key
+
+    Nodes pass a barrier before every calibration, so they load the
+    storage at the same time, like during the benchmark itself. The
+    cache is attached to executors as `calibration` attribute.
+    """
+    # one representative per (block size, action class, flags)
+    calibrations = []
+    known = set()
+    for params in benchmarks:
+        key = CalibrationCache.key(None, None, params)
+        if key not in known:
+            known.add(key)
+            calibrations.append(params)
+
+    barriers = [Barrier(len(executors)) for _ in calibrations]
+    errors = []
+
+    def calibrate(executor, filename):
+        for params, barrier in zip(calibrations, barriers):
+            # failed node still passes all barriers, not to block others
+            barrier.wait()
+            try:
+                calibrated_size(executor, params, filename, timeout,
+                                iozone_path)
+            except Exception as exc:
+                errors.append((executor.node, exc))
+
+    for executor, _ in executors:
+        executor.calibration = cache
+
+    threads = []
+    for executor, filename in executors:
+        th = threading.Thread(target=calibrate, args=(executor, filename))
+        th.daemon = True
+        threads.append(th)
+        th.start()
+
+    for th in threads:
+        th.join()
+
+    cache.save()
+
+    if errors:
+        msg = ", ".join("{0}: {1!r}".format(*err) for err in errors)
+        raise RuntimeError("Fail to calibrate " + msg)
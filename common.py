@@ -1,4 +1,17 @@
-import subprocess
+from executors import SSHExecutor, subprocess_run
+from stats import hist_percentile
+
+
+# scalar Results attributes, which describe benchmark outcome
+METRIC_FIELDS = ('bw_mean', 'bw_dev', 'bw_max', 'bw_min', 'bw_samples',
+                 'iops', 'lat_p50', 'lat_p99', 'lat_p999', 'lat_p9999',
+                 'converged')
+
+# (Results attribute, completion latency percentile)
+LAT_PERCENTILES = [('lat_p50', 50),
+                   ('lat_p99', 99),
+                   ('lat_p999', 99.9),
+                   ('lat_p9999', 99.99)]
 
 
 class BenchmarkOption(object):
@@ -10,7 +23,44 @@ class BenchmarkOption(object):
         self.size = size
         self.direct_io = False
         self.use_hight_io_priority = True
+        # fio io engine and its tunables ('hipri', 'sqthread_poll=1', ...)
+        self.ioengine = 'libaio'
+        self.engine_options = []
+        # fio: run jobs as threads instead of processes and place them
+        # into the same file region ('shared'), separate files
+        # ('separate') or separate regions of the same file ('offset')
+        self.use_threads = False
+        self.job_files = 'shared'
+        # target files are already laid out and filled by prepare phase
+        self.prepared = False
         self.sync = False
+        # fio log averaging interval in msec, None - don't collect logs
+        self.log_interval = None
+        # fio steady state criterion (e.g. 'bw_slope:0.3%'), duration and
+        # ramp time in seconds. Timeout becomes a max run time, if set
+        self.steadystate = None
+        self.ss_duration = 30
+        self.ss_ramp = 10
+        # node counters sampling interval in seconds, None - don't sample
+        self.telemetry_interval = None
+        # named workload profile (see workloads.py) and its extra fio
+        # options ('rwmixread=70', 'bssplit=...'), None for plain action
+        self.workload = None
+        self.workload_options = []
+        # trace replay (see replay.py): local trace path, timing speedup,
+        # ignore trace timing, offset shift of every next node in KiB,
+        # "node:filename" of all replaying targets and trace summary
+        self.replay_trace = None
+        self.replay_speed = 1.0
+        self.replay_no_stall = False
+        self.replay_node_offset = 0
+        self.replay_targets = None
+        self.replay_expected = None
+
+    @property
+    def label(self):
+        "results type: workload name or fio action"
+        return self.workload or self.action
 
 
 class RunOptions(object):
@@ -23,59 +73,112 @@ class Results(object):
     def __init__(self):
         # depend on test utility used
         self.parameters = None
+        self.node = None
         self.type = None
         self.block_size = None
         self.concurence = None
         self.iodepth = None
+        self.ioengine = None
         self.bw_dev = None
         self.bw_mean = None
         self.bw_max = None
         self.bw_min = None
+        # amount of bw measurements bw_mean/bw_dev are calculated from
+        self.bw_samples = None
+        self.iops = None
+
+        # completion latency histogram {usec: io_count} and percentiles
+        self.clat_hist = None
+        self.lat_p50 = None
+        self.lat_p99 = None
+        self.lat_p999 = None
+        self.lat_p9999 = None
+
+        # stats.TimeSeries with per-interval bw/iops/lat
+        self.time_series = None
+
+        # True if steady state was reached before timeout,
+        # None if steady state detection wasn't requested
+        self.converged = None
+
+        # single node: io start/end, epoch seconds of the local clock
+        self.start_time = None
+        self.end_time = None
+
+        # cluster: [(node, start, end)], interval when all nodes were
+        # active, bw within it and [(node, start skew in seconds)]
+        self.node_times = None
+        self.overlap = None
+        self.bw_overlap = None
+        self.skew = None
+
+        # single node: results of every job, if there are several
+        self.job_results = None
+
+        # cluster: results of every node and Jain's fairness index of
+        # node throughputs
+        self.node_results = None
+        self.jain_index = None
+
+        # unparsed benchmark output, single node results only
+        self.raw_output = None
+
+        # single node: host counters summary for the benchmark window,
+        # see telemetry.summarize
+        self.telemetry = None
+
+        # single node: trace replay achievements against the original
+        # trace timing, see replay.replay_comparison
+        self.replay = None
+
+    def update_lat_percentiles(self):
+        for attr, percent in LAT_PERCENTILES:
+            setattr(self, attr, hist_percentile(self.clat_hist, percent))
 
     def __str__(self):
-        frmt = "<{0} bsize={1} type={4} bw={2}~{3}>".format
-        return frmt(self.__class__.__name__,
-                    self.block_size,
-                    self.bw_mean,
-                    self.bw_dev,
-                    self.type)
+        frmt = "<{0} bsize={1} type={4} bw={2}~{3} iops={5} p99={6}us>"
+        return frmt.format(self.__class__.__name__,
+                           self.block_size,
+                           self.bw_mean,
+                           self.bw_dev,
+                           self.type,
+                           self.iops,
+                           self.lat_p99)
 
     def __repr__(self):
         return str(self)
 
 
+def result_engine(bench_type, ioengine):
+    """io engine to label results with
+
+    Engine is a fio option, iozone has none and pyio is an engine itself.
+    """
+    if bench_type in ('fio', 'replay'):
+        return ioengine
+    if bench_type == 'pyio':
+        return 'pyio'
+    return None
+
+
 def subprocess_executor(cmd):
     print "LOCALHOST >> " + " ".join(cmd) + "\n",
-    return subprocess.Popen(cmd, stdout=subprocess.PIPE).stdout.read()
+    code, out, err = subprocess_run(cmd)
+    if code != 0:
+        print "LOCALHOST << exit code", code, err.strip()
+    return out
 subprocess_executor.node = 'localhost'
+subprocess_executor.run = subprocess_run
+
+
+def local_put_file(data, path):
+    print "LOCALHOST << " + path + "\n",
+    with open(path, "w") as fd:
+        fd.write(data)
+subprocess_executor.put_file = local_put_file
 
 
 def get_paramiko_executor(host, user, password, key_file=None):
-    try:
-        import paramiko
-    except ImportError:
-        msg = "Can't use ssh protocol. No paramiko module available"
-        raise ValueError(msg)
-
-    ssh = paramiko.SSHClient()
-    ssh.load_host_keys('/dev/null')
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.known_hosts = None
-
-    if password == '-':
-        if key_file is None:
-            raise ValueError("password is '-' and no key_file provided")
-        else:
-            ssh.connect(host, username=user, key_filename=key_file,
-                        look_for_keys=False)
-    else:
-        ssh.connect(host, username=user, password=password)
-
-    def paramiko_executor(cmd):
-        print host + " >> " + " ".join(cmd) + "\n",
-        stdin, stdout, stderr = ssh.exec_command(" ".join(cmd))
-        return stdout.read()
-
-    paramiko_executor.node = host
-
-    return paramiko_executor
+    executor = SSHExecutor(host, user, password, key_file)
+    executor.connect()
+    return executor
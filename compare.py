@@ -0,0 +1,179 @@
+import argparse
+
+from resultdb import ResultsDB, DEFAULT_DB, metrics_to_results
+from common import result_engine
+from stats import welch_ttest, mean_dev, merge_histograms, hist_percentile
+
+
+def point_key(row):
+    return (row['parameters'].get('workload') or row['action'],
+            row['blocksize'], row['concurence'], row['iodepth'],
+            result_engine(row['bench_type'],
+                          row['parameters'].get('ioengine', 'libaio')) or "-")
+
+
+class PointStats(object):
+    """Summary of all node results of a single benchmark point
+
+    Throughput is compared per node, so result sets of clusters with
+    different amount of nodes are still comparable.
+    """
+
+    def __init__(self, node_results):
+        self.count = len(node_results)
+        self.nodes = len(set(node for node, _ in node_results))
+
+        bws = [res.bw_mean for _, res in node_results]
+        self.bw_mean, self.bw_dev = mean_dev(bws)
+        self.bw_total = self.bw_mean * self.nodes
+
+        # single result - use fio's own per-sample deviation instead
+        if self.count == 1:
+            res = node_results[0][1]
+            self.bw_dev = res.bw_dev or 0.0
+            self.count = res.bw_samples or 1
+
+        hists = [res.clat_hist for _, res in node_results]
+        if all(hist is not None for hist in hists):
+            self.lat_p99 = hist_percentile(merge_histograms(*hists), 99)
+        else:
+            lats = [res.lat_p99 for _, res in node_results
+                    if res.lat_p99 is not None]
+            self.lat_p99 = mean_dev(lats)[0] if lats else None
+
+
+def load_points(db, run_id):
+    points = {}
+    for row in db.query(run_id=run_id):
+        points.setdefault(point_key(row), []).append(
+            (row['node'], metrics_to_results(row)))
+
+    if len(points) == 0:
+        raise ValueError("No results found for run {0!r}".format(run_id))
+
+    return dict((key, PointStats(node_results))
+                for key, node_results in points.items())
+
+
+def percent_delta(old, new):
+    if old is None or new is None or old == 0:
+        return None
+    return (float(new) - old) * 100.0 / old
+
+
+class PointDiff(object):
+    def __init__(self, key, base, new, threshold, lat_threshold, alpha):
+        self.key = key
+        self.base = base
+        self.new = new
+        self.bw_delta = percent_delta(base.bw_mean, new.bw_mean)
+        self.lat_delta = percent_delta(base.lat_p99, new.lat_p99)
+        _, self.p_value = welch_ttest(base.bw_mean, base.bw_dev, base.count,
+                                      new.bw_mean, new.bw_dev, new.count)
+
+        # without enough data to test significance trust the threshold
+        significant = self.p_value is None or self.p_value < alpha
+
+        self.bw_regression = self.bw_delta is not None and \
+            self.bw_delta < -threshold and significant
+        self.lat_regression = self.lat_delta is not None and \
+            self.lat_delta > lat_threshold
+
+    @property
+    def regression(self):
+        return self.bw_regression or self.lat_regression
+
+
+def compare_runs(db, base_run_id, new_run_id, threshold=10.0,
+                 lat_threshold=None, alpha=0.05):
+    """Compares two stored result sets point by point
+
+    :returns: (list of PointDiff, keys of points missing in one of sets)
+    """
+    if lat_threshold is None:
+        lat_threshold = threshold
+
+    base = load_points(db, base_run_id)
+    new = load_points(db, new_run_id)
+
+    diffs = [PointDiff(key, base[key], new[key], threshold, lat_threshold,
+                       alpha)
+             for key in sorted(set(base) & set(new))]
+    missing = sorted(set(base) ^ set(new))
+    return diffs, missing
+
+
+def format_delta(val):
+    if val is None:
+        return "-"
+    return "{0:+.1f}%".format(val)
+
+
+def format_diffs(diffs, missing):
+    fields = 'Type BlockSize Concurence Iodepth Engine BaseBW NewBW BW% P ' + \
+             'BaseP99us NewP99us P99% Status'
+    yield fields
+
+    for diff in diffs:
+        status = []
+        if diff.bw_regression:
+            status.append("BW_REGRESSION")
+        if diff.lat_regression:
+            status.append("LAT_REGRESSION")
+
+        row = list(diff.key)
+        row += [int(diff.base.bw_total), int(diff.new.bw_total),
+                format_delta(diff.bw_delta),
+                "-" if diff.p_value is None else
+                "{0:.3f}".format(diff.p_value),
+                "-" if diff.base.lat_p99 is None else int(diff.base.lat_p99),
+                "-" if diff.new.lat_p99 is None else int(diff.new.lat_p99),
+                format_delta(diff.lat_delta),
+                ",".join(status) or "OK"]
+        yield " ".join(map(str, row))
+
+    for key in missing:
+        yield " ".join(map(str, key)) + " present only in one result set"
+
+
+def _parse_compare_args(args):
+    parser = argparse.ArgumentParser(
+        prog="bench.py compare",
+        description="Compare two stored result sets and detect regressions")
+    parser.add_argument("baseline", metavar="BASE_RUN_ID")
+    parser.add_argument("new", metavar="NEW_RUN_ID")
+    parser.add_argument(
+        "--db", metavar="DB_PATH", default=DEFAULT_DB,
+        help="results database")
+    parser.add_argument(
+        "--threshold", metavar="PERCENT", type=float, default=10.0,
+        help="max allowed throughput drop")
+    parser.add_argument(
+        "--lat-threshold", metavar="PERCENT", type=float, default=None,
+        help="max allowed p99 latency grow, equal to --threshold by default")
+    parser.add_argument(
+        "--alpha", metavar="P_VALUE", type=float, default=0.05,
+        help="significance level for throughput change")
+    return parser.parse_args(args)
+
+
+def compare_main(args):
+    """Prints comparison of two result sets
+
+    :returns: 1 if any regression found, 0 otherwise
+    """
+    args_obj = _parse_compare_args(args)
+    db = ResultsDB(args_obj.db)
+    diffs, missing = compare_runs(db, args_obj.baseline, args_obj.new,
+                                  args_obj.threshold, args_obj.lat_threshold,
+                                  args_obj.alpha)
+    db.close()
+
+    for line in format_diffs(diffs, missing):
+        print line
+
+    regressions = [diff for diff in diffs if diff.regression]
+    if regressions:
+        print len(regressions), "regression(s) found"
+        return 1
+    return 0
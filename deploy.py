@@ -0,0 +1,103 @@
+import os
+import uuid
+import Queue
+import hashlib
+import threading
+
+
+DEFAULT_DEPLOY_DIR = "/dev/shm/disk_bench"
+
+
+def remote_path(local_path, digest, dst_dir=DEFAULT_DEPLOY_DIR):
+    "binary location on nodes, different contents never share a path"
+    return "{0}/{1}-{2}".format(dst_dir, os.path.basename(local_path),
+                                digest[:16])
+
+
+def remote_hash(executor, path):
+    "returns sha256 of the remote file, None if there is no such file"
+    code, out, _ = executor.run(["sha256sum", path])
+    if code != 0 or not out.strip():
+        return None
+    return out.split()[0]
+
+
+def deploy_binary(executor, data, digest, path):
+    """Copies binary to a node, unless it is already there
+
+    :returns: True if the binary was copied
+    """
+    if remote_hash(executor, path) == digest:
+        return False
+
+    executor(["mkdir", "-p", os.path.dirname(path)])
+
+    # rename is atomic, so concurrent readers never see a partial file
+    tmp_path = "{0}.{1}.tmp".format(path, uuid.uuid4().hex[:8])
+    executor.put_file(data, tmp_path)
+    executor(["chmod", "a+x", tmp_path])
+    executor(["mv", "-f", tmp_path, path])
+
+    if remote_hash(executor, path) != digest:
+        raise RuntimeError("Hash mismatch for {0} on {1}".format(
+            path, executor.node))
+    return True
+
+
+def deploy_all(executors, local_path, dst_dir=DEFAULT_DEPLOY_DIR,
+               workers=8):
+    """Distributes local binary to all nodes
+
+    Binary is stored under its content hash, nodes, which already have
+    it, are skipped. At most `workers` nodes are copied concurrently.
+
+    :returns: remote path of the binary, the same for all nodes
+    """
+    with open(local_path, "rb") as fd:
+        data = fd.read()
+    digest = hashlib.sha256(data).hexdigest()
+    path = remote_path(local_path, digest, dst_dir)
+
+    # several executors may share a node, copy once per node
+    nodes = {}
+    for executor in executors:
+        nodes.setdefault(executor.node, executor)
+
+    tasks = Queue.Queue()
+    for executor in nodes.values():
+        tasks.put(executor)
+
+    copied = []
+    errors = []
+
+    def worker():
+        while True:
+            try:
+                executor = tasks.get_nowait()
+            except Queue.Empty:
+                return
+
+            try:
+                if deploy_binary(executor, data, digest, path):
+                    copied.append(executor.node)
+            except Exception as exc:
+                errors.append((executor.node, exc))
+
+    threads = []
+    for _ in range(min(workers, len(nodes))):
+        th = threading.Thread(target=worker)
+        th.daemon = True
+        threads.append(th)
+        th.start()
+
+    for th in threads:
+        th.join()
+
+    if errors:
+        msg = ", ".join("{0}: {1!r}".format(*err) for err in errors)
+        raise RuntimeError("Fail to deploy {0} to {1}".format(local_path,
+                                                              msg))
+
+    print "Deployed", local_path, "as", path, "to", len(copied), "node(s),",
+    print len(nodes) - len(copied), "already had it"
+    return path
@@ -0,0 +1,272 @@
+import os
+import time
+import pipes
+import socket
+import select
+import threading
+import subprocess
+
+from profiler import PROFILER
+
+
+# exceptions, after which ssh connection is reestablished and command retried
+RECONNECT_EXCEPTIONS = (socket.error, EOFError)
+
+
+def import_paramiko():
+    try:
+        import paramiko
+    except ImportError:
+        msg = "Can't use ssh protocol. No paramiko module available"
+        raise ValueError(msg)
+
+    global RECONNECT_EXCEPTIONS
+    RECONNECT_EXCEPTIONS = (socket.error, EOFError, paramiko.SSHException)
+    return paramiko
+
+
+class SSHConnectionPool(object):
+    """Keeps a single persistent ssh connection per (host, user)
+
+    Every connection is a multiplexed transport, so any amount of
+    channels (commands) may run over it in parallel.
+    """
+
+    def __init__(self, keepalive=15, connect_timeout=30):
+        self.keepalive = keepalive
+        self.connect_timeout = connect_timeout
+        self.clients = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def _host_lock(self, key):
+        with self.lock:
+            return self.locks.setdefault(key, threading.Lock())
+
+    def _connect(self, host, user, password, key_file):
+        paramiko = import_paramiko()
+
+        ssh = paramiko.SSHClient()
+        ssh.load_host_keys('/dev/null')
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh.known_hosts = None
+
+        if password == '-':
+            if key_file is None:
+                raise ValueError("password is '-' and no key_file provided")
+            else:
+                ssh.connect(host, username=user, key_filename=key_file,
+                            look_for_keys=False,
+                            timeout=self.connect_timeout)
+        else:
+            ssh.connect(host, username=user, password=password,
+                        timeout=self.connect_timeout)
+
+        ssh.get_transport().set_keepalive(self.keepalive)
+        return ssh
+
+    def get_client(self, host, user, password, key_file=None,
+                   failed=None):
+        """Returns connected SSHClient for host
+
+        Connection is (re)established if it doesn't exists yet, was lost
+        or it is the `failed` one. Other commands may already have
+        replaced the failed client, then the new one is reused.
+        """
+        key = (host, user)
+        with self._host_lock(key):
+            ssh = self.clients.get(key)
+
+            if ssh is not None:
+                transport = ssh.get_transport()
+                if ssh is failed or transport is None or \
+                        not transport.is_active():
+                    ssh.close()
+                    ssh = None
+
+            if ssh is None:
+                ssh = self._connect(host, user, password, key_file)
+                self.clients[key] = ssh
+
+            return ssh
+
+    def close_all(self):
+        with self.lock:
+            for ssh in self.clients.values():
+                ssh.close()
+            self.clients.clear()
+
+
+DEFAULT_POOL = SSHConnectionPool()
+
+
+class SSHExecutor(object):
+    """Executes commands on remote host over pooled ssh connection
+
+    `executor(cmd)` returns command stdout, `executor.run(cmd)` returns
+    (exit_status, stdout, stderr). Up to `max_channels` commands run on
+    the same host concurrently. Commands, failed due to connection
+    problems, are retried after reconnect.
+    """
+
+    def __init__(self, host, user, password, key_file=None,
+                 pool=DEFAULT_POOL, max_channels=4, retry_count=3,
+                 retry_timeout=5):
+        self.node = host
+        self.user = user
+        self.password = password
+        self.key_file = key_file
+        self.pool = pool
+        self.channels = threading.BoundedSemaphore(max_channels)
+        self.retry_count = retry_count
+        self.retry_timeout = retry_timeout
+
+    def connect(self, failed=None):
+        return self.pool.get_client(self.node, self.user, self.password,
+                                    self.key_file, failed=failed)
+
+    def _retry(self, func, *args):
+        ssh = None
+        for counter in range(self.retry_count + 1):
+            try:
+                ssh = self.connect(failed=ssh)
+                return func(ssh, *args)
+            except RECONNECT_EXCEPTIONS as exc:
+                if counter == self.retry_count:
+                    raise
+                print self.node, "connection error", repr(exc),
+                print ", reconnecting"
+                time.sleep(self.retry_timeout)
+
+    def _run(self, ssh, cmd, out_cb):
+        with self.channels:
+            launch_start = time.time()
+            channel = ssh.get_transport().open_session()
+            try:
+                channel.exec_command(cmd)
+                PROFILER.add('launch', launch_start, time.time(), self.node)
+
+                stdout = []
+                stderr = []
+                while True:
+                    select.select([channel], [], [], 1.0)
+
+                    got_data = False
+                    while channel.recv_ready():
+                        data = channel.recv(65536)
+                        stdout.append(data)
+                        got_data = True
+                        if out_cb is not None:
+                            out_cb(data)
+
+                    while channel.recv_stderr_ready():
+                        stderr.append(channel.recv_stderr(65536))
+                        got_data = True
+
+                    if not got_data and channel.exit_status_ready() and \
+                            not channel.recv_ready() and \
+                            not channel.recv_stderr_ready():
+                        break
+
+                    if channel.closed and not got_data:
+                        break
+
+                # channel is closed without status, if connection is lost
+                if not channel.exit_status_ready():
+                    transport = ssh.get_transport()
+                    if transport is None or not transport.is_active():
+                        raise EOFError("Connection to {0} is lost"
+                                       .format(self.node))
+                    raise EOFError("Channel to {0} is closed without exit "
+                                   "status".format(self.node))
+
+                return (channel.recv_exit_status(),
+                        "".join(stdout), "".join(stderr))
+            finally:
+                channel.close()
+
+    def run(self, cmd, out_cb=None):
+        """Runs command, streaming stdout chunks to `out_cb`
+
+        :returns: (exit_status, stdout, stderr)
+        """
+        cmd = " ".join(pipes.quote(arg) for arg in cmd)
+        return self._retry(self._run, cmd, out_cb)
+
+    def __call__(self, cmd):
+        print self.node + " >> " + " ".join(cmd) + "\n",
+        code, out, err = self.run(cmd)
+        if code != 0:
+            print self.node, "<< exit code", code, err.strip()
+        return out
+
+    def _put_file(self, ssh, data, path):
+        with self.channels:
+            sftp = ssh.open_sftp()
+            try:
+                with sftp.open(path, "w") as fd:
+                    fd.write(data)
+            finally:
+                sftp.close()
+
+    def put_file(self, data, path):
+        print self.node + " << " + path + "\n",
+        with PROFILER.span('transfer', self.node):
+            self._retry(self._put_file, data, path)
+
+
+def subprocess_run(cmd, out_cb=None):
+    """Runs local command, streaming stdout chunks to `out_cb`
+
+    :returns: (exit_status, stdout, stderr)
+    """
+    with PROFILER.span('launch'):
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+
+    stderr = []
+    err_th = threading.Thread(target=lambda: stderr.append(
+        proc.stderr.read()))
+    err_th.daemon = True
+    err_th.start()
+
+    stdout = []
+    for data in iter(lambda: os.read(proc.stdout.fileno(), 65536), ''):
+        stdout.append(data)
+        if out_cb is not None:
+            out_cb(data)
+
+    code = proc.wait()
+    err_th.join()
+    return code, "".join(stdout), "".join(stderr)
+
+
+def connect_all(executors):
+    """Establishes connections of all executors in parallel
+
+    :param executors: list of executors, executors without `connect`
+                      method are ignored
+    """
+    errors = []
+
+    def connect(executor):
+        try:
+            with PROFILER.span('connect', executor.node):
+                executor.connect()
+        except Exception as exc:
+            errors.append((executor.node, exc))
+
+    threads = []
+    for executor in executors:
+        if hasattr(executor, 'connect'):
+            th = threading.Thread(target=connect, args=(executor,))
+            th.daemon = True
+            threads.append(th)
+            th.start()
+
+    for th in threads:
+        th.join()
+
+    if errors:
+        msg = ", ".join("{0}: {1!r}".format(*err) for err in errors)
+        raise RuntimeError("Fail to connect to " + msg)
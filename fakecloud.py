@@ -0,0 +1,273 @@
+"""In-memory stand-in for nova and cinder clients
+
+Only the calls, used by `provision`, are implemented. Servers and volumes
+change states after configurable delays and fail with given probability,
+so provisioning throughput and retry paths can be checked offline:
+
+    python fakecloud.py --amount 10 --fail-rate 0.2
+"""
+
+import sys
+import time
+import uuid
+import random
+import argparse
+import threading
+
+from provision import Provisioner, Poller, delete_all
+
+
+class FakeObject(object):
+    def __init__(self, **attrs):
+        self.id = str(uuid.uuid4())
+        self.__dict__.update(attrs)
+
+
+class FakeCloud(object):
+    """Shared state of fake nova and cinder
+
+    :param boot_time: seconds till server becomes active
+    :param volume_time: seconds till volume becomes available
+    :param delete_time: seconds till deleted object disappears
+    :param fail_rate: probability of server or volume to end up in error
+    """
+
+    def __init__(self, boot_time=3.0, volume_time=1.0, delete_time=1.0,
+                 fail_rate=0.0, seed=None):
+        self.boot_time = boot_time
+        self.volume_time = volume_time
+        self.delete_time = delete_time
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.servers = {}
+        self.volumes = {}
+        self.floating_ips = []
+        self.api_calls = 0
+
+    def call(self):
+        self.api_calls += 1
+
+    def ready_at(self, delay):
+        # +-50% jitter, like a real cloud
+        return time.time() + delay * self.random.uniform(0.5, 1.5)
+
+    def failed(self):
+        return self.random.random() < self.fail_rate
+
+    def update(self):
+        now = time.time()
+        for srv in self.servers.values():
+            if srv._deleted_at is not None:
+                if now >= srv._deleted_at:
+                    del self.servers[srv.id]
+                    for vol in self.volumes.values():
+                        if vol._server_id == srv.id:
+                            vol._server_id = None
+                            vol.status = 'available'
+            elif srv._state == 'building' and now >= srv._ready_at:
+                srv._state = 'error' if srv._fail else 'active'
+
+        for vol in self.volumes.values():
+            if vol._deleted_at is not None:
+                if now >= vol._deleted_at:
+                    del self.volumes[vol.id]
+            elif vol.status == 'creating' and now >= vol._ready_at:
+                vol.status = 'error' if vol._fail else 'available'
+
+
+class FakeServer(FakeObject):
+    def __init__(self, cloud, name):
+        FakeObject.__init__(self, name=name)
+        self._cloud = cloud
+        self._state = 'building'
+        self._ready_at = cloud.ready_at(cloud.boot_time)
+        self._fail = cloud.failed()
+        self._deleted_at = None
+
+    def __getattr__(self, name):
+        if name == 'OS-EXT-STS:vm_state':
+            return self._state
+        raise AttributeError(name)
+
+    def add_floating_ip(self, flt_ip):
+        with self._cloud.lock:
+            self._cloud.call()
+            if self._state != 'active':
+                raise RuntimeError("Server {0} isn't active".format(
+                    self.name))
+            flt_ip.instance_id = self.id
+
+
+class FakeServers(object):
+    def __init__(self, cloud):
+        self.cloud = cloud
+
+    def create(self, name, flavor=None, image=None, nics=None,
+               key_name=None):
+        with self.cloud.lock:
+            self.cloud.call()
+            srv = FakeServer(self.cloud, name)
+            self.cloud.servers[srv.id] = srv
+            return srv
+
+    def get(self, srv):
+        with self.cloud.lock:
+            self.cloud.call()
+            self.cloud.update()
+            return self.cloud.servers[getattr(srv, 'id', srv)]
+
+    def list(self):
+        with self.cloud.lock:
+            self.cloud.call()
+            self.cloud.update()
+            return list(self.cloud.servers.values())
+
+    def delete(self, srv):
+        with self.cloud.lock:
+            self.cloud.call()
+            srv = self.cloud.servers.get(getattr(srv, 'id', srv))
+            if srv is not None and srv._deleted_at is None:
+                srv._state = 'deleting'
+                srv._deleted_at = self.cloud.ready_at(self.cloud.delete_time)
+
+
+class FakeServerVolumes(object):
+    def __init__(self, cloud):
+        self.cloud = cloud
+
+    def create_server_volume(self, server_id, volume_id, device):
+        with self.cloud.lock:
+            self.cloud.call()
+            vol = self.cloud.volumes[volume_id]
+            if vol.status != 'available':
+                raise RuntimeError("Volume {0} isn't available".format(
+                    vol.display_name))
+            vol.status = 'in-use'
+            vol._server_id = server_id
+
+
+class FakeFloatingIPs(object):
+    def __init__(self, cloud):
+        self.cloud = cloud
+
+    def list(self):
+        with self.cloud.lock:
+            self.cloud.call()
+            return list(self.cloud.floating_ips)
+
+    def create(self, pool=None):
+        with self.cloud.lock:
+            self.cloud.call()
+            flt_ip = FakeObject(ip="172.16.0.{0}".format(
+                                len(self.cloud.floating_ips) + 1),
+                                pool=pool, instance_id=None)
+            self.cloud.floating_ips.append(flt_ip)
+            return flt_ip
+
+
+class FakeFinder(object):
+    def find(self, **attrs):
+        return FakeObject(**attrs)
+
+
+class FakeNova(object):
+    def __init__(self, cloud):
+        self.servers = FakeServers(cloud)
+        self.volumes = FakeServerVolumes(cloud)
+        self.floating_ips = FakeFloatingIPs(cloud)
+        self.networks = FakeFinder()
+        self.flavors = FakeFinder()
+        self.images = FakeFinder()
+
+
+class FakeVolumes(object):
+    def __init__(self, cloud):
+        self.cloud = cloud
+
+    def create(self, size, display_name=None):
+        with self.cloud.lock:
+            self.cloud.call()
+            vol = FakeObject(size=size, display_name=display_name,
+                             status='creating')
+            vol._ready_at = self.cloud.ready_at(self.cloud.volume_time)
+            vol._fail = self.cloud.failed()
+            vol._deleted_at = None
+            vol._server_id = None
+            self.cloud.volumes[vol.id] = vol
+            return vol
+
+    def get(self, vol):
+        with self.cloud.lock:
+            self.cloud.call()
+            self.cloud.update()
+            return self.cloud.volumes[getattr(vol, 'id', vol)]
+
+    def list(self):
+        with self.cloud.lock:
+            self.cloud.call()
+            self.cloud.update()
+            return list(self.cloud.volumes.values())
+
+    def delete(self, vol):
+        with self.cloud.lock:
+            self.cloud.call()
+            vol = self.cloud.volumes[getattr(vol, 'id', vol)]
+            if vol.status not in ('available', 'error'):
+                raise RuntimeError("Can't delete volume in state " +
+                                   vol.status)
+            vol.status = 'deleting'
+            vol._deleted_at = self.cloud.ready_at(self.cloud.delete_time)
+
+
+class FakeCinder(object):
+    def __init__(self, cloud):
+        self.volumes = FakeVolumes(cloud)
+
+
+def fake_clients(**cloud_params):
+    "returns (nova, cinder, cloud)"
+    cloud = FakeCloud(**cloud_params)
+    return FakeNova(cloud), FakeCinder(cloud), cloud
+
+
+def _parse_args(args):
+    parser = argparse.ArgumentParser(
+        description="Run VM provisioning against the fake cloud")
+    parser.add_argument("--amount", type=int, default=10)
+    parser.add_argument("--boot-time", type=float, default=3.0)
+    parser.add_argument("--volume-time", type=float, default=1.0)
+    parser.add_argument("--prepare-time", type=float, default=1.0,
+                        help="time, spent to prepare a single host")
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(args)
+
+
+def main(argv):
+    opts = _parse_args(argv)
+    nova, cinder, cloud = fake_clients(boot_time=opts.boot_time,
+                                       volume_time=opts.volume_time,
+                                       fail_rate=opts.fail_rate,
+                                       seed=opts.seed)
+
+    def on_ready(ip, srv):
+        time.sleep(opts.prepare_time)
+
+    poller = Poller(interval=0.1, max_interval=1.0)
+    provisioner = Provisioner(nova, cinder, None, None, [], None, 1,
+                              on_ready=on_ready, poller=poller)
+
+    stime = time.time()
+    try:
+        result = provisioner.run(opts.amount)
+    finally:
+        ptime = time.time() - stime
+        delete_all(nova, cinder, poller=Poller(0.1, 1.0))
+
+    print len(result), "VMs are ready in {0:.1f}s,".format(ptime),
+    print provisioner.retries, "retries,", cloud.api_calls, "api calls"
+    return 0
+
+if __name__ == "__main__":
+    exit(main(sys.argv[1:]))
@@ -13,66 +13,449 @@
 #  License for the specific language governing permissions and limitations
 #  under the License.
 
+import re
 import time
 import json
+import uuid
 import os.path
 
 from common import Results
+from profiler import PROFILER
+from timesync import clock_offset, start_delay_ms
+from stats import parse_fio_clat_hist, fio_log_to_buckets, TimeSeries
+from stats import merge_histograms, sum_dev
+
+
+FIO_LOG_RE = re.compile(r"^(?P<prefix>.*)_(?P<kind>bw|iops|lat)" +
+                        r"(\.\d+)?\.log$")
+
+# rw modes, which do both reads and writes
+MIXED_ACTIONS = ('rw', 'readwrite', 'randrw')
+
+
+def fio_steadystate_options(params):
+    if not params.steadystate:
+        return []
+    return ["steadystate={0}".format(params.steadystate),
+            "steadystate_duration={0}".format(params.ss_duration),
+            "steadystate_ramp_time={0}".format(params.ss_ramp)]
+
+
+def fio_log_options(log_prefix, interval):
+    return ["write_bw_log={0}".format(log_prefix),
+            "write_iops_log={0}".format(log_prefix),
+            "write_lat_log={0}".format(log_prefix),
+            "log_avg_msec={0}".format(interval)]
+
+
+def make_log_dir(executor):
+    log_dir = "/tmp/fio_logs_{0}".format(uuid.uuid4().hex)
+    executor(["mkdir", "-p", log_dir])
+    return log_dir
+
+
+def collect_fio_logs(executor, log_dir):
+    """Pulls fio bw/iops/lat logs from node and removes them there
+
+    :returns: dict {(log_prefix, kind): [log lines of every job]}
+    """
+    logs = {}
+    with PROFILER.span('transfer'):
+        for fname in executor(["ls", log_dir]).split():
+            match = FIO_LOG_RE.match(fname)
+            if match is None:
+                continue
+
+            key = (match.group('prefix'), match.group('kind'))
+            data = executor(["cat", log_dir + "/" + fname])
+            logs.setdefault(key, []).append(data.splitlines())
+
+        executor(["rm", "-rf", log_dir])
+    return logs
+
+
+def fio_job_start_ms(fio_output, job):
+    "returns job start time in epoch msec"
+    if 'job_start' in job:
+        return job['job_start']
+
+    # old fio versions only provide the time, when output was generated
+    if 'timestamp_ms' in fio_output:
+        end_ms = fio_output['timestamp_ms']
+    else:
+        end_ms = fio_output.get('timestamp', time.time()) * 1000
+
+    return end_ms - job.get('elapsed', 0) * 1000
+
+
+def job_local_start_ms(executor, fio_output, job):
+    "returns job start time in epoch msec of the local clock"
+    return fio_job_start_ms(fio_output, job) - clock_offset(executor) * 1000
+
+
+def set_job_times(res, executor, fio_output, jobs):
+    "sets node io start/end timestamps of the local clock"
+    start_times = []
+    end_times = []
+    for job in jobs:
+        runtime = job.get('job_runtime')
+        if runtime is None:
+            runtime = max(job.get('read', {}).get('runtime', 0),
+                          job.get('write', {}).get('runtime', 0))
+
+        start_ms = job_local_start_ms(executor, fio_output, job)
+        start_times.append(start_ms / 1000.0)
+        end_times.append((start_ms + runtime) / 1000.0)
+
+    res.start_time = min(start_times)
+    res.end_time = max(end_times)
+
+
+def make_time_series(fio_output, logs, log_prefix, interval, start_ms):
+    # fio-3.x logs latency in nsec, older versions in usec
+    version = re.match(r"fio-(\d+)", fio_output.get("fio version", ""))
+    lat_coef = 1000.0 if version and int(version.group(1)) >= 3 else 1.0
+
+    bw = fio_log_to_buckets(logs.get((log_prefix, 'bw'), []),
+                            start_ms, interval)
+    iops = fio_log_to_buckets(logs.get((log_prefix, 'iops'), []),
+                              start_ms, interval)
+    lat = fio_log_to_buckets(logs.get((log_prefix, 'lat'), []),
+                             start_ms, interval)
+
+    buckets = {}
+    for bucket_no in set(bw) | set(iops) | set(lat):
+        lat_sum, lat_count = lat.get(bucket_no, (0.0, 0))
+        lat_mean = lat_sum / lat_count / lat_coef if lat_count else 0.0
+        buckets[bucket_no] = (bw.get(bucket_no, (0.0, 0))[0],
+                              iops.get(bucket_no, (0.0, 0))[0],
+                              lat_mean)
+
+    return TimeSeries.from_buckets(interval, buckets)
+
+
+def fio_file_options(params, filename):
+    """Returns fio options, which place benchmark jobs to files
+
+    If there are several jobs they either share the same file region
+    ('shared'), each uses its own file ('separate') or its own region
+    of the shared file/device ('offset').
+    """
+    size = params.size
+    concurence = int(params.concurence)
+
+    if concurence > 1 and params.job_files == 'separate':
+        directory, fname = os.path.split(filename)
+        opts = ["directory={0}".format(directory or '.'),
+                "filename_format={0}.$jobnum".format(fname)]
+    else:
+        opts = ["filename={0}".format(filename)]
+        if concurence > 1 and params.job_files == 'offset' and \
+                size is not None:
+            size = size // concurence
+            opts.append("offset_increment={0}k".format(size))
+
+    if size is not None:
+        opts.append("size={0}k".format(size))
+
+    return opts
+
+
+# engine specific tunables, passed only to engines, which know them
+ENGINE_TUNABLES = {'io_uring': ('hipri', 'fixedbufs', 'registerfiles',
+                                'sqthread_poll', 'sqthread_poll_cpu',
+                                'nonvectored'),
+                   'pvsync2': ('hipri', 'hipri_percentage'),
+                   'libaio': ('userspace_reap',)}
+
+
+class UnsupportedEngine(ValueError):
+    pass
+
+
+def fio_engine_options(params):
+    opts = ["ioengine={0}".format(params.ioengine)]
+    known = ENGINE_TUNABLES.get(params.ioengine, ())
+    for opt in params.engine_options:
+        if opt.partition('=')[0] in known:
+            opts.append(opt)
+    return opts
+
+
+def fio_engines(executor, fio_path='fio'):
+    """Returns set of io engines, node fio supports
+
+    Result is cached in executor `fio_engines` attribute.
+    None, if fio doesn't report them.
+    """
+    cache = getattr(executor, 'fio_engines', None)
+    if cache is None:
+        cache = executor.fio_engines = {}
+
+    if fio_path not in cache:
+        code, out, _ = executor.run([fio_path, "--enghelp"])
+        engines = None
+        if code == 0 and "Available IO engines:" in out:
+            listing = out.split("Available IO engines:", 1)[1]
+            engines = set(line.strip() for line in listing.splitlines()
+                          if line.strip())
+        cache[fio_path] = engines
+
+    return cache[fio_path]
+
+
+def check_engine(executor, params, fio_path='fio'):
+    engines = fio_engines(executor, fio_path)
+    if engines is not None and params.ioengine not in engines:
+        raise UnsupportedEngine("fio on {0} doesn't support {1} engine"
+                                .format(executor.node, params.ioengine))
+
+
+def fio_bench_options(params, filename):
+    "returns fio options of a benchmark, in `name=value` form"
+    opts = ["rw={0}".format(params.action)]
+
+    # bssplit replaces the single blocksize
+    if not any(opt.startswith('bssplit=') for opt in params.workload_options):
+        opts.append("blocksize={0}k".format(params.blocksize))
+
+    opts.extend(params.workload_options)
+    opts.extend(fio_engine_options(params))
+    opts += ["iodepth={0}".format(params.iodepth),
+            "numjobs={0}".format(params.concurence),
+            "sync=" + ('1' if params.sync else '0')]
+
+    opts.extend(fio_file_options(params, filename))
+
+    if params.direct_io:
+        opts.append("direct=1")
+
+    if params.use_hight_io_priority:
+        opts.append("prio=0")
+
+    if params.use_threads:
+        opts.append("thread")
+
+    opts.extend(fio_steadystate_options(params))
+    return opts
 
 
 def run_fio_once(executor, params, filename, timeout, fio_path='fio',
-                 sync_obj=None):
+                 sync_obj=None, log_prefix=None):
 
     cmd_line = [fio_path,
                 "--name=%s" % params.action,
-                "--rw=%s" % params.action,
-                "--blocksize=%sk" % params.blocksize,
-                "--ioengine=libaio",
-                "--iodepth=%d" % params.iodepth,
-                "--filename=%s" % filename,
-                "--size={0}k".format(params.size),
                 "--timeout=%d" % timeout,
                 "--runtime=%d" % timeout,
-                "--numjobs={0}".format(params.concurence),
-                "--output-format=json",
-                "--sync=" + ('1' if params.sync else '0')]
+                "--output-format=json+"]
 
-    if params.direct_io:
-        cmd_line.append("--direct=1")
+    cmd_line.extend("--" + opt for opt in fio_bench_options(params, filename))
 
-    if params.use_hight_io_priority:
-        cmd_line.append("--prio=0")
+    if log_prefix is not None:
+        cmd_line.extend("--" + opt for opt in
+                        fio_log_options(log_prefix, params.log_interval))
 
     if sync_obj:
-        sync_obj.wait()
+        start_at = sync_obj.wait()
+        if start_at is not None:
+            delay = start_delay_ms(executor, start_at)
+            cmd_line.append("--startdelay={0}ms".format(delay))
+
+    return executor(cmd_line)
+
+
+def parse_fio_job(benchmark, job_output):
+    res = Results()
+
+    if benchmark.action in MIXED_ACTIONS:
+        parts = [job_output['read'], job_output['write']]
+    elif benchmark.action in ('write', 'randwrite'):
+        parts = [job_output['write']]
+    else:
+        parts = [job_output['read']]
+
+    # mixed workload is reported as a sum of its reads and writes
+    res.bw_mean = sum(part['bw_mean'] for part in parts)
+    res.bw_dev = sum_dev(part['bw_dev'] for part in parts)
+    res.bw_max = sum(part['bw_max'] for part in parts)
+    res.bw_min = sum(part['bw_min'] for part in parts)
+    res.iops = sum(part['iops'] for part in parts)
+
+    samples = [part.get('bw_samples') for part in parts]
+    if None not in samples:
+        res.bw_samples = min(samples)
+
+    if benchmark.steadystate:
+        steadystate = job_output.get('steadystate', {})
+        res.converged = bool(steadystate.get('attained', False))
+
+    res.clat_hist = merge_histograms(*[parse_fio_clat_hist(part)
+                                       for part in parts])
+    res.update_lat_percentiles()
 
-    raw_out = executor(cmd_line)
-    for counter in range(100):
-        fname = "/tmp/fio_raw_{0}_{1}.json".format(time.time(), counter)
-        if not os.path.exists(fname):
-            break
-    open(fname, "w").write(raw_out)
-    return json.loads(raw_out)
+    return res
+
+
+def parse_fio_jobs(benchmark, jobs_output):
+    """Merges results of all jobs (numjobs) of the benchmark
+
+    Per-job results are kept in `job_results` if there are several jobs.
+    """
+    job_results = [parse_fio_job(benchmark, job) for job in jobs_output]
+    if len(job_results) == 1:
+        return job_results[0]
+
+    res = Results()
+    res.job_results = job_results
+    res.bw_mean = sum(job.bw_mean for job in job_results)
+    res.bw_dev = sum_dev(job.bw_dev for job in job_results)
+    res.bw_max = max(job.bw_max for job in job_results)
+    res.bw_min = min(job.bw_min for job in job_results)
+    res.iops = sum(job.iops for job in job_results)
+
+    if all(job.bw_samples is not None for job in job_results):
+        res.bw_samples = min(job.bw_samples for job in job_results)
+
+    if benchmark.steadystate:
+        res.converged = all(job.converged for job in job_results)
+
+    res.clat_hist = merge_histograms(*[job.clat_hist for job in job_results])
+    res.update_lat_percentiles()
+
+    return res
+
+
+def parse_fio_output(benchmark, raw_out):
+    "parses raw json+ output of a single benchmark fio run"
+    res = parse_fio_jobs(benchmark, json.loads(raw_out)["jobs"])
+    res.raw_output = raw_out
+    return res
 
 
 def run_fio(executor, benchmark, filename, timeout, fio_path='fio',
             sync_obj=None):
 
-    job_output = run_fio_once(executor,
-                              benchmark,
-                              filename,
-                              timeout,
-                              fio_path,
-                              sync_obj=sync_obj)
-    job_output = job_output["jobs"][0]
-    res = Results()
+    check_engine(executor, benchmark, fio_path)
 
-    if benchmark.action in ('write', 'randwrite'):
-        raw_result = job_output['write']
-    else:
-        raw_result = job_output['read']
+    log_dir = None
+    log_prefix = None
+    if benchmark.log_interval:
+        log_dir = make_log_dir(executor)
+        log_prefix = log_dir + "/" + benchmark.action
+
+    raw_out = run_fio_once(executor,
+                           benchmark,
+                           filename,
+                           timeout,
+                           fio_path,
+                           sync_obj=sync_obj,
+                           log_prefix=log_prefix)
+    with PROFILER.span('parse'):
+        fio_output = json.loads(raw_out)
+        jobs_output = fio_output["jobs"]
+        res = parse_fio_jobs(benchmark, jobs_output)
+        res.raw_output = raw_out
+        set_job_times(res, executor, fio_output, jobs_output)
 
-    for field in 'bw_dev bw_mean bw_max bw_min'.split():
-        setattr(res, field, raw_result[field])
+    if log_dir is not None:
+        logs = collect_fio_logs(executor, log_dir)
+        start_ms = job_local_start_ms(executor, fio_output, jobs_output[0])
+        with PROFILER.span('parse'):
+            res.time_series = make_time_series(fio_output, logs,
+                                               benchmark.action,
+                                               benchmark.log_interval,
+                                               start_ms)
 
     return res
+
+
+def fio_job_name(idx, params):
+    return "b{0}_{1}_{2}k_c{3}_d{4}".format(idx, params.action,
+                                           params.blocksize,
+                                           params.concurence,
+                                           params.iodepth)
+
+
+def make_fio_config(benchmarks, filename, timeout, log_dir=None):
+    """Returns fio job file, which runs all benchmarks one by one
+
+    Each benchmark becomes a separated `stonewall`ed job section, so fio
+    waits for the previous one to finish before starting the next.
+    If `log_dir` is given, per-interval logs of each job are stored there.
+    """
+
+    cfg = ["[global]",
+           "timeout={0}".format(timeout),
+           "runtime={0}".format(timeout),
+           ""]
+
+    for idx, params in enumerate(benchmarks):
+        cfg.append("[{0}]".format(fio_job_name(idx, params)))
+        cfg.append("stonewall")
+        cfg.extend(fio_bench_options(params, filename))
+
+        if log_dir is not None and params.log_interval:
+            log_prefix = log_dir + "/" + fio_job_name(idx, params)
+            cfg.extend(fio_log_options(log_prefix, params.log_interval))
+
+        cfg.append("")
+
+    return "\n".join(cfg)
+
+
+def run_fio_batch(executor, benchmarks, filename, timeout, fio_path='fio',
+                  sync_obj=None):
+    """Runs all benchmarks with a single fio invocation
+
+    Returns list of `Results`, in the same order as `benchmarks`.
+    """
+
+    benchmarks = list(benchmarks)
+    for params in benchmarks:
+        check_engine(executor, params, fio_path)
+
+    log_dir = None
+    if any(params.log_interval for params in benchmarks):
+        log_dir = make_log_dir(executor)
+
+    cfg_path = "/tmp/fio_batch_{0}.fio".format(uuid.uuid4().hex)
+    cfg = make_fio_config(benchmarks, filename, timeout, log_dir)
+    executor.put_file(cfg, cfg_path)
+
+    if sync_obj:
+        sync_obj.wait()
+
+    raw_out = executor([fio_path, "--output-format=json+", cfg_path])
+    executor(["rm", "-f", cfg_path])
+
+    parse_start = time.time()
+    fio_output = json.loads(raw_out)
+
+    jobs = {}
+    for job in fio_output["jobs"]:
+        jobs.setdefault(job['jobname'], []).append(job)
+    PROFILER.add('parse', parse_start, time.time())
+
+    logs = {} if log_dir is None else collect_fio_logs(executor, log_dir)
+
+    parse_start = time.time()
+    results = []
+    for idx, params in enumerate(benchmarks):
+        job_name = fio_job_name(idx, params)
+        res = parse_fio_jobs(params, jobs[job_name])
+
+        # keep only own jobs, so raw output looks like a separated fio run
+        job_fio_output = dict(fio_output, jobs=jobs[job_name])
+        res.raw_output = json.dumps(job_fio_output)
+        set_job_times(res, executor, fio_output, jobs[job_name])
+
+        if log_dir is not None and params.log_interval:
+            start_ms = job_local_start_ms(executor, fio_output,
+                                          jobs[job_name][0])
+            res.time_series = make_time_series(fio_output, logs, job_name,
+                                               params.log_interval,
+                                               start_ms)
+        results.append(res)
+
+    PROFILER.add('parse', parse_start, time.time())
+    return results
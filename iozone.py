@@ -1,5 +1,8 @@
 import re
+import copy
+
 from common import Results
+from profiler import PROFILER
 
 # run iozone disk io tests
 # see http://www.iozone.org/ for more detailes
@@ -33,12 +36,18 @@ class IOZoneParser(object):
                               r"for\s+\d+\s+(?P<cmd>.*?)\s+=\s+" +
                               r"(?P<perf>[\d.]+)\s+KB/sec")
 
+    # throughput mode (-t) test names
     cmap = {'initial writers': 'write',
             'rewriters': 'rewrite',
             'initial readers': 'read',
+            'readers': 'read',
             're-readers': 'reread',
             'random readers': 'random read',
-            'random writers': 'random write'}
+            'random writers': 'random write',
+            'reverse readers': 'bkwd read',
+            'stride readers': 'stride read',
+            'fwriters': 'fwrite',
+            'freaders': 'fread'}
 
     string1 = "                           " + \
               "                   random  random    " + \
@@ -111,13 +120,84 @@ class IOZoneParser(object):
                     parsed_res[key] = perf
         return parsed_res
 
+    @classmethod
+    def parse_iozone_table(cls, res):
+        """Parses all rows of single-thread results table
+
+        Auto mode (-a) produces row for every file size/record size pair.
+        Returns list of dicts, 'KB' and 'reclen' keys are kept.
+        """
+        rows = []
+        sres = res.split('\n')
+
+        for pos, line in enumerate(sres[1:]):
+            if line.strip() == cls.string2 and \
+                        sres[pos].strip() == cls.string1.strip():
+                add_pos = line.index(cls.string2)
+
+                npos = [(name, start + add_pos, stop + add_pos)
+                        for name, start, stop in cls.positions]
+
+                for row in sres[pos + 2:]:
+                    # file sizes are separated by empty lines
+                    if row.strip() == '':
+                        continue
+
+                    if not row.strip()[0].isdigit():
+                        break
+
+                    parsed_row = {}
+                    for itm, val in cls.apply_parts(npos, row):
+                        if val.strip() != '':
+                            parsed_row[itm[0]] = int(val.strip())
+                    rows.append(parsed_row)
+        return rows
+
 
 IOZoneParser.make_positions()
 
 
-def do_run_iozone(executor, params, filename, timeout, iozone_path='iozone',
-                  microsecond_mode=False, sync_obj=None):
+# benchmark action -> (iozone test number, results column)
+IOZONE_ACTIONS = {'write': ('0', 'write'),
+                  'rewrite': ('0', 'rewrite'),
+                  'read': ('1', 'read'),
+                  'reread': ('1', 'reread'),
+                  'randread': ('2', 'random read'),
+                  'randwrite': ('2', 'random write'),
+                  'bkwdread': ('3', 'bkwd read'),
+                  'recrewrite': ('4', 'record rewrite'),
+                  'strideread': ('5', 'stride read'),
+                  'fwrite': ('6', 'fwrite'),
+                  'frewrite': ('6', 'frewrite'),
+                  'fread': ('7', 'fread'),
+                  'freread': ('7', 'freread')}
+
+
+def iozone_action(action):
+    try:
+        return IOZONE_ACTIONS[action]
+    except KeyError:
+        raise ValueError("Unknown action {0!r}".format(action))
+
+
+def check_iozone_action(params):
+    "throughput mode (several threads) doesn't report some tests"
+    _, column = iozone_action(params.action)
+    if int(params.concurence) > 1 and \
+            column not in IOZoneParser.cmap.values():
+        raise ValueError("iozone doesn't report {0} action with several "
+                         "threads".format(params.action))
 
+
+def iozone_files(params, filename):
+    threads = int(params.concurence)
+    if threads == 1:
+        return [filename]
+    return [filename + "_{0}".format(i) for i in range(threads)]
+
+
+def iozone_cmd(iozone_path, params, filename, tests, microsecond_mode=False):
+    "returns iozone command line without size and record size options"
     cmd = [iozone_path]
 
     if params.sync:
@@ -129,35 +209,49 @@ def do_run_iozone(executor, params, filename, timeout, iozone_path='iozone',
     if microsecond_mode:
         cmd.append('-N')
 
-    all_files = []
-    threads = int(params.concurence)
-    if 1 != threads:
-        cmd.extend(('-t', str(threads), '-F'))
-        filename = filename + "_{}"
-        cmd.extend(filename % i for i in range(threads))
-        all_files.extend(filename % i for i in range(threads))
+    all_files = iozone_files(params, filename)
+    if len(all_files) != 1:
+        cmd.extend(('-t', str(len(all_files)), '-F'))
+        cmd.extend(all_files)
     else:
         cmd.extend(('-f', filename))
-        all_files.append(filename)
 
+    # all tests, except write, use files created by the write test.
+    # Prepared files already exist, they are kept (-w) and aren't
+    # rewritten, unless the write test is requested
+    tests = set(tests)
+    if params.prepared:
+        cmd.append('-w')
+    else:
+        tests.add('0')
+
+    for test in sorted(tests):
+        cmd.extend(('-i', test))
+
+    return cmd
+
+
+def prefill_files(executor, params, filename, iozone_path):
     bsz = 1024 if params.size > 1024 else params.size
     if params.size % bsz != 0:
         fsz = (params.size // bsz + 1) * bsz
     else:
         fsz = params.size
 
-    for fname in all_files:
-        executor(["iozone", "-f", fname, "-i", "0",
+    for fname in iozone_files(params, filename):
+        executor([iozone_path, "-f", fname, "-i", "0",
                   "-s",  str(fsz), "-r", str(bsz), "-w"])
 
-    cmd.append('-i')
 
-    if params.action == 'write':
-        cmd.append("0")
-    elif params.action == 'randwrite':
-        cmd.append("2")
-    else:
-        raise ValueError("Unknown action {0!r}".format(params.action))
+def do_run_iozone(executor, params, filename, timeout, iozone_path='iozone',
+                  microsecond_mode=False, sync_obj=None):
+
+    check_iozone_action(params)
+    test, _ = iozone_action(params.action)
+    cmd = iozone_cmd(iozone_path, params, filename, [test], microsecond_mode)
+
+    if not params.prepared:
+        prefill_files(executor, params, filename, iozone_path)
 
     cmd.extend(('-s', str(params.size)))
     cmd.extend(('-r', str(params.blocksize)))
@@ -167,18 +261,37 @@ def do_run_iozone(executor, params, filename, timeout, iozone_path='iozone',
 
     raw_res = executor(cmd)
     try:
-        parsed_res = IOZoneParser.parse_iozone_res(raw_res, threads > 1)
-
-        res = Results()
-
-        if params.action == 'write':
-            res.bw_mean = parsed_res['write']
-        elif params.action == 'randwrite':
-            res.bw_mean = parsed_res['random write']
+        with PROFILER.span('parse'):
+            res = parse_iozone_output(params, raw_res)
     except:
         print raw_res
         raise
 
+    return res
+
+
+def parse_iozone_output(params, raw_res):
+    """Extracts results of the benchmark from iozone output
+
+    Output may contain several tests and (in auto mode) record sizes,
+    only ones, related to `params`, are used.
+    """
+    threads = int(params.concurence)
+    _, column = iozone_action(params.action)
+
+    if threads > 1:
+        parsed_res = IOZoneParser.parse_iozone_res(raw_res, True)
+    else:
+        rows = [row for row in IOZoneParser.parse_iozone_table(raw_res)
+                if row.get('reclen') == params.blocksize]
+        if len(rows) == 0:
+            raise ValueError("No results for {0}k records found".format(
+                params.blocksize))
+        parsed_res = rows[-1]
+
+    res = Results()
+    res.raw_output = raw_res
+    res.bw_mean = parsed_res[column]
     res.bw_dev = 0
     res.bw_max = res.bw_mean
     res.bw_min = res.bw_mean
@@ -186,16 +299,129 @@ def do_run_iozone(executor, params, filename, timeout, iozone_path='iozone',
     return res
 
 
+def calibrate_size(executor, params, filename, timeout, iozone_path):
+    "returns file size, which takes about `timeout` seconds to process"
+    params = copy.copy(params)
+    params.size = params.blocksize * 50
+    res_time = do_run_iozone(executor, params, filename, timeout,
+                             iozone_path,
+                             microsecond_mode=True)
+    size = (params.blocksize * timeout * 1000000) / res_time.bw_mean
+    return (size // params.blocksize + 1) * params.blocksize
+
+
+def calibrated_size(executor, params, filename, timeout, iozone_path):
+    """Returns file size for `timeout`, using executor `calibration` cache
+
+    See `calibration.CalibrationCache`, cache is updated on miss.
+    """
+    cache = getattr(executor, 'calibration', None)
+    if cache is None:
+        return calibrate_size(executor, params, filename, timeout,
+                              iozone_path)
+
+    key = cache.key(executor.node, filename, params)
+    size = cache.get(key, timeout)
+    if size is None:
+        size = calibrate_size(executor, params, filename, timeout,
+                              iozone_path)
+        cache.set(key, timeout, size)
+    return size
+
+
 def run_iozone(executor, params, filename, timeout, iozone_path='iozone',
                sync_obj=None):
 
     if timeout is not None:
-        params.size = params.blocksize * 50
-        res_time = do_run_iozone(executor, params, filename, timeout,
-                                 iozone_path,
-                                 microsecond_mode=True)
-        size = (params.blocksize * timeout * 1000000) / res_time.bw_mean
-        size = (size // params.blocksize + 1) * params.blocksize
-        params.size = size
+        params.size = calibrated_size(executor, params, filename, timeout,
+                                      iozone_path)
     return do_run_iozone(executor, params, filename, timeout, iozone_path,
                          sync_obj=sync_obj)
+
+
+def is_power_of_two(val):
+    return val > 0 and val & (val - 1) == 0
+
+
+def iozone_invocations(benchmarks):
+    """Groups benchmarks into as few iozone invocations as possible
+
+    Benchmarks with the same file options share an invocation, which
+    runs all required tests. Single-thread benchmarks also share record
+    sizes via auto mode if all of them are powers of two.
+    Returns list of (common params, [record sizes], [benchmark indexes]).
+    """
+    groups = []
+    for idx, params in enumerate(benchmarks):
+        check_iozone_action(params)
+        key = (int(params.concurence), params.size, params.sync,
+               params.direct_io, params.prepared)
+        for group_key, group in groups:
+            if group_key == key:
+                group.append(idx)
+                break
+        else:
+            groups.append((key, [idx]))
+
+    invocations = []
+    for key, group in groups:
+        params = benchmarks[group[0]]
+        rec_sizes = sorted(set(benchmarks[idx].blocksize for idx in group))
+
+        if int(params.concurence) == 1 and len(rec_sizes) > 1 and \
+                all(is_power_of_two(rsize) for rsize in rec_sizes):
+            invocations.append((params, rec_sizes, group))
+        else:
+            for rsize in rec_sizes:
+                invocations.append((params, [rsize],
+                                    [idx for idx in group
+                                     if benchmarks[idx].blocksize == rsize]))
+    return invocations
+
+
+def run_iozone_batch(executor, benchmarks, filename, timeout,
+                     iozone_path='iozone', sync_obj=None):
+    """Runs all benchmarks with as few iozone invocations as possible
+
+    Returns list of `Results`, in the same order as `benchmarks`.
+    """
+    benchmarks = list(benchmarks)
+    results = [None] * len(benchmarks)
+
+    for params, rec_sizes, group in iozone_invocations(benchmarks):
+        params = copy.copy(params)
+        params.blocksize = rec_sizes[0]
+
+        if timeout is not None:
+            params.size = calibrated_size(executor, params, filename,
+                                          timeout, iozone_path)
+
+        tests = [iozone_action(benchmarks[idx].action)[0] for idx in group]
+        cmd = iozone_cmd(iozone_path, params, filename, tests)
+
+        if not params.prepared:
+            prefill_files(executor, params, filename, iozone_path)
+
+        if len(rec_sizes) == 1:
+            cmd.extend(('-s', str(params.size)))
+            cmd.extend(('-r', str(rec_sizes[0])))
+        else:
+            cmd.extend(('-a', '-n', str(params.size), '-g', str(params.size),
+                        '-y', str(rec_sizes[0]), '-q', str(rec_sizes[-1])))
+
+        if sync_obj is not None:
+            sync_obj.wait()
+            sync_obj = None
+
+        raw_res = executor(cmd)
+        for idx in group:
+            benchmarks[idx].size = params.size
+            try:
+                with PROFILER.span('parse'):
+                    results[idx] = parse_iozone_output(benchmarks[idx],
+                                                       raw_res)
+            except:
+                print raw_res
+                raise
+
+    return results
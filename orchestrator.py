@@ -0,0 +1,143 @@
+import Queue
+import threading
+
+from profiler import PROFILER
+
+
+class Barrier(object):
+    """One-shot barrier for `counter` threads
+
+    Thread, which fails before the barrier, must call `release`, so others
+    don't wait for it forever.
+    """
+
+    def __init__(self, counter):
+        self.counter = counter
+        self.arrived = set()
+        self.c_lock = threading.Lock()
+        self.ready_loc = threading.Lock()
+        self.ready_loc.acquire()
+
+    def arrive(self):
+        "counts the calling thread, only once"
+        with self.c_lock:
+            ident = threading.current_thread().ident
+            if ident in self.arrived:
+                return
+            self.arrived.add(ident)
+            self.counter -= 1
+            if self.counter == 0:
+                self.ready_loc.release()
+
+    def wait(self):
+        with PROFILER.span('barrier'):
+            self.arrive()
+            self.ready_loc.acquire()
+            self.ready_loc.release()
+
+    def release(self):
+        "lets others pass without the calling thread, no-op after `wait`"
+        self.arrive()
+
+
+class NodeWorker(threading.Thread):
+    """Long-lived worker, which runs benchmarks on a single node
+
+    Tasks are (task_id, benchmark, sync_obj) tuples, results are put
+    into `res_q` as (task_id, executor, result). `run_func(executor,
+    filename, benchmark, sync_obj)` must return result or None on failure.
+    """
+
+    def __init__(self, executor, filename, run_func, res_q):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.executor = executor
+        self.filename = filename
+        self.run_func = run_func
+        self.res_q = res_q
+        self.tasks = Queue.Queue()
+
+    def run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+
+            task_id, benchmark, sync_obj = task
+            res = self.run_func(self.executor, self.filename, benchmark,
+                                sync_obj)
+            self.res_q.put((task_id, self.executor, res))
+
+    def stop(self):
+        self.tasks.put(None)
+
+
+class Orchestrator(object):
+    """Runs benchmark set on all nodes with one worker per node
+
+    Workers live for the whole set, so an instance can be run only once.
+    `make_sync(nodes_count)` creates lockstep synchronization object.
+
+    Two scheduling modes are supported:
+
+    * 'lockstep' - all nodes start every benchmark simultaneously and the
+      next benchmark starts only after all nodes finish the current one
+    * 'pipeline' - every node goes through the benchmark set at its own
+      pace, results are reported once all nodes finish a benchmark
+    """
+
+    schedules = ('lockstep', 'pipeline')
+
+    def __init__(self, executors, run_func, make_sync=Barrier):
+        self.make_sync = make_sync
+        self.res_q = Queue.Queue()
+        self.workers = [NodeWorker(executor, filename, run_func, self.res_q)
+                        for executor, filename in executors]
+
+    def run(self, benchmark_set, schedule='lockstep'):
+        """Yields list of (executor, result) for every benchmark, in order"""
+
+        if schedule not in self.schedules:
+            raise ValueError("Unknown schedule {0!r}".format(schedule))
+
+        for worker in self.workers:
+            worker.start()
+
+        try:
+            if schedule == 'lockstep':
+                for benchmark in benchmark_set:
+                    self.submit(0, benchmark,
+                                self.make_sync(len(self.workers)))
+                    yield next(self.collect())
+            else:
+                benchmark_set = list(benchmark_set)
+                for task_id, benchmark in enumerate(benchmark_set):
+                    self.submit(task_id, benchmark, None)
+
+                # results come out of order, so keep them till
+                # all nodes are done with previous benchmarks
+                for node_results in self.collect(len(benchmark_set)):
+                    yield node_results
+        finally:
+            for worker in self.workers:
+                worker.stop()
+            for worker in self.workers:
+                worker.join()
+
+    def submit(self, task_id, benchmark, sync_obj):
+        for worker in self.workers:
+            worker.tasks.put((task_id, benchmark, sync_obj))
+
+    def collect(self, tasks_count=1):
+        """Yields node results of tasks 0..tasks_count - 1 in order"""
+        node_results = dict((task_id, []) for task_id in range(tasks_count))
+        next_task = 0
+
+        while next_task < tasks_count:
+            task_id, executor, res = self.res_q.get()
+            node_results[task_id].append((executor, res))
+
+            while next_task < tasks_count and \
+                    len(node_results[next_task]) == len(self.workers):
+                yield node_results.pop(next_task)
+                next_task += 1
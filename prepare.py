@@ -0,0 +1,138 @@
+import json
+import threading
+
+
+# sustained random write till iops become stable
+PRECONDITION_STEADYSTATE = "iops_slope:0.3%"
+
+
+def target_files(filename, benchmarks, bench_type):
+    "returns all files, which benchmarks are going to use"
+    max_concurence = max(int(bench.concurence) for bench in benchmarks)
+    files = [filename]
+
+    if bench_type == 'iozone':
+        if max_concurence > 1:
+            files = [filename + "_{0}".format(i)
+                     for i in range(max_concurence)]
+    elif any(bench.job_files == 'separate' and int(bench.concurence) > 1
+             for bench in benchmarks):
+        files.extend(filename + ".{0}".format(i)
+                     for i in range(max_concurence))
+
+    return files
+
+
+def prepare_descr(files, size, precondition):
+    return json.dumps({'files': files,
+                       'size': size,
+                       'precondition': precondition}, sort_keys=True)
+
+
+def marker_path(filename):
+    return filename + ".prepared"
+
+
+def is_prepared(executor, filename, files, size, descr):
+    "checks marker and that all files are still there and have proper size"
+    code, out, _ = executor.run(["cat", marker_path(filename)])
+    if code != 0 or out.strip() != descr:
+        return False
+
+    code, out, _ = executor.run(["stat", "-c", "%s"] + files)
+    if code != 0:
+        return False
+
+    return all(int(fsize) >= size * 1024 for fsize in out.split())
+
+
+def fill_file(executor, fname, size, bench_type, bin_path):
+    "lays out file and fills it with random data"
+    if bench_type in ('fio', 'replay'):
+        executor([bin_path, "--name=prepare", "--rw=write", "--bs=1M",
+                  "--ioengine=libaio", "--iodepth=16",
+                  "--filename={0}".format(fname),
+                  "--size={0}k".format(size),
+                  "--refill_buffers", "--randrepeat=0",
+                  "--output-format=json"])
+    else:
+        executor(["dd", "if=/dev/urandom", "of={0}".format(fname), "bs=1k",
+                  "count={0}".format(size), "conv=notrunc"])
+
+
+def precondition_file(executor, fname, size, max_time, bin_path):
+    "sustained random write till device performance is stable"
+    executor([bin_path, "--name=precondition", "--rw=randwrite",
+              "--bs=4k", "--ioengine=libaio", "--iodepth=32",
+              "--direct=1", "--filename={0}".format(fname),
+              "--size={0}k".format(size), "--time_based",
+              "--runtime={0}".format(max_time),
+              "--steadystate={0}".format(PRECONDITION_STEADYSTATE),
+              "--steadystate_duration=60",
+              "--output-format=json"])
+
+
+def prepare_node(executor, filename, benchmarks, bench_param,
+                 precondition=None, force=False):
+    """Lays out and preconditions target files once for whole set
+
+    Files are sized for the largest benchmark. A marker file next to the
+    target describes what was done, so the next run skips this phase.
+
+    :param precondition: max time of sustained write preconditioning,
+                         None - don't precondition (fio only)
+    """
+    bench_type, bin_path = bench_param
+    size = max(bench.size for bench in benchmarks)
+    if size is None:
+        raise ValueError("Can't prepare files without size")
+
+    files = target_files(filename, benchmarks, bench_type)
+    descr = prepare_descr(files, size, precondition)
+
+    if not force and is_prepared(executor, filename, files, size, descr):
+        print executor.node, "files are already prepared"
+        return
+
+    executor(["rm", "-f", marker_path(filename)])
+
+    for fname in files:
+        fill_file(executor, fname, size, bench_type, bin_path)
+        if precondition and bench_type in ('fio', 'replay'):
+            precondition_file(executor, fname, size, precondition, bin_path)
+
+    executor.put_file(descr, marker_path(filename))
+
+
+def prepare_all(executors, benchmarks, bench_param, precondition=None,
+                force=False):
+    """Runs prepare phase on all nodes in parallel
+
+    All benchmarks are marked as `prepared`, so they reuse files.
+    """
+    benchmarks = list(benchmarks)
+    errors = []
+
+    def prepare(executor, filename):
+        try:
+            prepare_node(executor, filename, benchmarks, bench_param,
+                         precondition, force)
+        except Exception as exc:
+            errors.append((executor.node, exc))
+
+    threads = []
+    for executor, filename in executors:
+        th = threading.Thread(target=prepare, args=(executor, filename))
+        th.daemon = True
+        threads.append(th)
+        th.start()
+
+    for th in threads:
+        th.join()
+
+    if errors:
+        msg = ", ".join("{0}: {1!r}".format(*err) for err in errors)
+        raise RuntimeError("Fail to prepare " + msg)
+
+    for bench in benchmarks:
+        bench.prepared = True
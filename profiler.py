@@ -0,0 +1,186 @@
+import time
+import json
+import threading
+import contextlib
+
+
+# spans, which contain other phases and aren't overhead by themselves
+OUTER_PHASES = ('benchmark', 'io')
+
+
+def benchmark_label(benchmark, bench_type='fio'):
+    label = "{0} {1}k c{2} d{3}".format(benchmark.label,
+                                        benchmark.blocksize,
+                                        benchmark.concurence,
+                                        benchmark.iodepth)
+    # io engine is a fio option, iozone and pyio ignore it. Trace replay
+    # is done by fio with the given engine
+    if bench_type in ('fio', 'replay'):
+        label += " " + benchmark.ioengine
+    return label
+
+
+class Span(object):
+    def __init__(self, phase, node, benchmark, start, end, thread):
+        self.phase = phase
+        self.node = node
+        self.benchmark = benchmark
+        self.start = start
+        self.end = end
+        self.thread = thread
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+class Profiler(object):
+    """Collects timestamped spans of sweep phases
+
+    Node and benchmark of a span are taken from the thread context, set
+    by `bind`, unless given explicitly. Does nothing, until enabled.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.start_time = None
+
+    def enable(self):
+        self.enabled = True
+        self.start_time = time.time()
+
+    @contextlib.contextmanager
+    def bind(self, node=None, benchmark=None):
+        "sets node and benchmark of spans, recorded by the current thread"
+        prev = getattr(self.local, 'context', (None, None))
+        self.local.context = (node if node is not None else prev[0],
+                              benchmark if benchmark is not None else prev[1])
+        try:
+            yield
+        finally:
+            self.local.context = prev
+
+    def add(self, phase, start, end, node=None, benchmark=None):
+        if not self.enabled:
+            return
+
+        ctx_node, ctx_benchmark = getattr(self.local, 'context',
+                                          (None, None))
+        span = Span(phase,
+                    node if node is not None else ctx_node,
+                    benchmark if benchmark is not None else ctx_benchmark,
+                    start, end, threading.current_thread().name)
+        with self.lock:
+            self.spans.append(span)
+
+    @contextlib.contextmanager
+    def span(self, phase, node=None, benchmark=None):
+        if not self.enabled:
+            yield
+            return
+
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(phase, start, time.time(), node, benchmark)
+
+
+PROFILER = Profiler()
+
+
+def phase_totals(spans):
+    "returns [(phase, count, total seconds)], the longest first"
+    totals = {}
+    for span in spans:
+        count, total = totals.get(span.phase, (0, 0.0))
+        totals[span.phase] = (count + 1, total + span.duration)
+    return sorted(((phase, count, total)
+                   for phase, (count, total) in totals.items()),
+                  key=lambda item: -item[2])
+
+
+def node_overhead(spans):
+    "returns [(node, benchmark seconds, io seconds)], max overhead first"
+    nodes = {}
+    for span in spans:
+        if span.phase not in OUTER_PHASES:
+            continue
+        bench_time, io_time = nodes.get(span.node, (0.0, 0.0))
+        if span.phase == 'benchmark':
+            bench_time += span.duration
+        else:
+            io_time += span.duration
+        nodes[span.node] = (bench_time, io_time)
+
+    return sorted(((node, bench_time, io_time)
+                   for node, (bench_time, io_time) in nodes.items()),
+                  key=lambda item: item[2] - item[1])
+
+
+def format_profile(profiler, top=5):
+    spans = list(profiler.spans)
+    if not spans:
+        return
+
+    wall = time.time() - profiler.start_time
+    io_total = sum(span.duration for span in spans if span.phase == 'io')
+    bench_total = sum(span.duration for span in spans
+                      if span.phase == 'benchmark')
+
+    yield "Profile: wall time {0:.1f}s".format(wall)
+    yield "  benchmarks {0:.1f}s node time, measured io {1:.1f}s, " \
+          "overhead {2:.1f}s".format(bench_total, io_total,
+                                     max(0.0, bench_total - io_total))
+
+    yield "  phases (count, total):"
+    for phase, count, total in phase_totals(spans):
+        if phase not in OUTER_PHASES:
+            yield "    {0} {1} {2:.2f}s".format(phase, count, total)
+
+    yield "  slowest spans:"
+    inner = [span for span in spans if span.phase not in OUTER_PHASES]
+    for span in sorted(inner, key=lambda span: -span.duration)[:top]:
+        yield "    {0} {1} {2} {3:.2f}s".format(span.phase,
+                                                 span.node or "controller",
+                                                 span.benchmark or "-",
+                                                 span.duration)
+
+    yield "  nodes (benchmark, io, overhead):"
+    for node, bench_time, io_time in node_overhead(spans)[:top]:
+        yield "    {0} {1:.1f}s {2:.1f}s {3:.1f}s".format(
+            node, bench_time, io_time, max(0.0, bench_time - io_time))
+
+
+def chrome_trace(profiler):
+    """Returns spans as Chrome trace-event json
+
+    Every node is a process, every thread is a thread of it.
+    """
+    events = []
+    pids = {}
+    tids = {}
+
+    for span in profiler.spans:
+        node = span.node or "controller"
+        if node not in pids:
+            pids[node] = len(pids) + 1
+            events.append({'name': 'process_name', 'ph': 'M',
+                           'pid': pids[node], 'args': {'name': node}})
+
+        tid = tids.setdefault(span.thread, len(tids) + 1)
+        event = {'name': span.phase,
+                 'cat': 'io' if span.phase == 'io' else 'overhead',
+                 'ph': 'X',
+                 'ts': int((span.start - profiler.start_time) * 1e6),
+                 'dur': int(span.duration * 1e6),
+                 'pid': pids[node],
+                 'tid': tid}
+        if span.benchmark is not None:
+            event['args'] = {'benchmark': span.benchmark}
+        events.append(event)
+
+    return json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'})
@@ -0,0 +1,265 @@
+import re
+import time
+import threading
+
+
+# name of servers and volumes, created for tests
+NAME_RE = re.compile(r"ceph-test-\d+$")
+
+
+def server_state(srv):
+    return getattr(srv, 'OS-EXT-STS:vm_state').lower()
+
+
+class Poller(object):
+    """Poll interval with backoff
+
+    Interval grows by `factor` up to `max_interval` while nothing
+    changes and is reset, once any progress is made.
+    """
+
+    def __init__(self, interval=1.0, max_interval=10.0, factor=1.5):
+        self.min_interval = interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.interval = interval
+
+    def sleep(self, progress):
+        if progress:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.factor,
+                                self.max_interval)
+        time.sleep(self.interval)
+
+
+class FloatingIPs(object):
+    "hands out floating ips to concurrent workers without collisions"
+
+    def __init__(self, nova, pool):
+        self.nova = nova
+        self.pool = pool
+        self.used = set()
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            ip_list = self.nova.floating_ips.list()
+
+            if self.pool is not None:
+                ip_list = [ip for ip in ip_list if ip.pool == self.pool]
+
+            ip_list = [ip for ip in ip_list if ip.instance_id is None]
+            ip_list = [ip for ip in ip_list if ip.ip not in self.used]
+
+            if len(ip_list) > 0:
+                flt_ip = ip_list[0]
+            else:
+                flt_ip = self.nova.floating_ips.create(self.pool)
+
+            self.used.add(flt_ip.ip)
+            return flt_ip
+
+
+class VMSlot(object):
+    "server and volume for a single test VM, and their creation attempts"
+
+    def __init__(self, index):
+        self.index = index
+        self.server = None
+        self.volume = None
+        self.server_attempts = 0
+        self.volume_attempts = 0
+        self.created_at = None
+        # None - provisioning, True - handed to finishing, False - failed
+        self.state = None
+
+
+class Provisioner(object):
+    """Creates test VMs as a concurrent pipeline
+
+    All servers and volumes are created at once. Their states are polled
+    with a single `servers.list` and `volumes.list` per tick. Failed
+    servers and volumes are recreated up to `retry_count` times. As soon
+    as a server is active and its volume is available, a separate thread
+    attaches the volume and a floating ip and calls `on_ready(ip, server)`,
+    e.g. to prepare the host, while other VMs are still booting.
+    """
+
+    def __init__(self, nova, cinder, flavor, image, nics, keypair_name,
+                 vol_sz, ip_pool=None, on_ready=None, retry_count=3,
+                 boot_timeout=240, poller=None):
+        self.nova = nova
+        self.cinder = cinder
+        self.flavor = flavor
+        self.image = image
+        self.nics = nics
+        self.keypair_name = keypair_name
+        self.vol_sz = vol_sz
+        self.ips = FloatingIPs(nova, ip_pool)
+        self.on_ready = on_ready
+        self.retry_count = retry_count
+        self.boot_timeout = boot_timeout
+        self.poller = poller if poller is not None else Poller()
+
+        self.lock = threading.Lock()
+        self.result = {}
+        self.errors = []
+        self.retries = 0
+
+    def create_server(self, slot):
+        slot.server_attempts += 1
+        slot.created_at = time.time()
+        slot.server = self.nova.servers.create(
+            "ceph-test-{0}".format(slot.index), flavor=self.flavor,
+            image=self.image, nics=self.nics, key_name=self.keypair_name)
+        print "Creating server", slot.server.name
+
+    def create_volume(self, slot):
+        slot.volume_attempts += 1
+        slot.volume = self.cinder.volumes.create(
+            size=self.vol_sz, display_name="ceph-test-{0}".format(slot.index))
+        print "Creating volume", slot.volume.display_name
+
+    def check_slot(self, slot, servers, volumes):
+        "updates slot from polled states, returns True on any progress"
+        progress = False
+
+        srv = servers.get(slot.server.id, slot.server)
+        sstate = server_state(srv)
+        timed_out = time.time() - slot.created_at > self.boot_timeout
+        if sstate == 'error' or (sstate != 'active' and timed_out):
+            print "Server", srv.name, "fails to start (" + sstate + ")"
+            self.nova.servers.delete(srv)
+            if slot.server_attempts > self.retry_count:
+                return self.fail(slot, "server fails to start")
+            self.retries += 1
+            self.create_server(slot)
+            return True
+        slot.server = srv
+
+        vol = volumes.get(slot.volume.id, slot.volume)
+        if vol.status == 'error':
+            print "Volume", vol.display_name, "fails to create"
+            self.cinder.volumes.delete(vol)
+            if slot.volume_attempts > self.retry_count:
+                return self.fail(slot, "volume fails to create")
+            self.retries += 1
+            self.create_volume(slot)
+            return True
+        slot.volume = vol
+
+        if sstate == 'active' and vol.status == 'available':
+            slot.state = True
+            th = threading.Thread(target=self.finish, args=(slot,))
+            th.daemon = True
+            th.start()
+            self.threads.append(th)
+            progress = True
+
+        return progress
+
+    def fail(self, slot, msg):
+        slot.state = False
+        with self.lock:
+            self.errors.append("ceph-test-{0}: {1}".format(slot.index, msg))
+        return True
+
+    def finish(self, slot):
+        srv = slot.server
+        try:
+            print "Attaching volume to", srv.name
+            self.nova.volumes.create_server_volume(srv.id, slot.volume.id,
+                                                   None)
+            flt_ip = self.ips.get()
+            print "Attaching ip", flt_ip.ip, "to", srv.name
+            srv.add_floating_ip(flt_ip)
+
+            if self.on_ready is not None:
+                self.on_ready(flt_ip.ip, srv)
+
+            with self.lock:
+                self.result[flt_ip.ip] = srv
+        except Exception as exc:
+            with self.lock:
+                self.errors.append("{0}: {1!r}".format(srv.name, exc))
+
+    def run(self, amount):
+        """Creates `amount` ready VMs
+
+        :returns: {floating_ip: server}
+        """
+        self.threads = []
+        slots = [VMSlot(index) for index in range(amount)]
+        for slot in slots:
+            self.create_server(slot)
+            self.create_volume(slot)
+
+        pending = slots
+        while pending:
+            servers = dict((srv.id, srv) for srv in self.nova.servers.list())
+            volumes = dict((vol.id, vol)
+                           for vol in self.cinder.volumes.list())
+
+            progress = False
+            for slot in pending:
+                progress = self.check_slot(slot, servers, volumes) or progress
+
+            pending = [slot for slot in pending if slot.state is None]
+            if pending:
+                self.poller.sleep(progress)
+
+        for th in self.threads:
+            th.join()
+
+        if self.errors:
+            print "ERROR: can't start required amount of servers:",
+            print ", ".join(self.errors)
+            raise RuntimeError("Fail to create {0} servers".format(amount))
+
+        return self.result
+
+
+def delete_all(nova, cinder, poller=None, timeout=300):
+    """Deletes all test servers and volumes
+
+    Servers are deleted at once, volumes - as soon as they are detached.
+    """
+    poller = poller if poller is not None else Poller()
+
+    deleted_srvs = set()
+    for srv in nova.servers.list():
+        if NAME_RE.match(srv.name):
+            print "Deleting server", srv.name
+            nova.servers.delete(srv)
+            deleted_srvs.add(srv.id)
+
+    deleted_vols = set()
+    stime = time.time()
+    while time.time() - stime < timeout:
+        all_id = set(srv.id for srv in nova.servers.list())
+        deleted_srvs &= all_id
+
+        test_vols = [vol for vol in cinder.volumes.list()
+                     if isinstance(vol.display_name, basestring) and
+                     NAME_RE.match(vol.display_name)]
+
+        progress = False
+        for vol in test_vols:
+            if vol.id not in deleted_vols and \
+                    vol.status in ('available', 'error'):
+                print "Deleting volume", vol.display_name
+                cinder.volumes.delete(vol)
+                deleted_vols.add(vol.id)
+                progress = True
+
+        left_vols = [vol for vol in test_vols if vol.id not in deleted_vols]
+        if not deleted_srvs and not left_vols:
+            break
+
+        poller.sleep(progress)
+    else:
+        print "Clearing timed out, some servers or volumes are left"
+        return
+
+    print "Clearing done (yet some volumes may still deleting)"
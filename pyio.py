@@ -0,0 +1,112 @@
+import json
+import os.path
+import hashlib
+
+from common import Results
+from profiler import PROFILER
+from deploy import deploy_binary
+from timesync import clock_offset, start_delay_ms
+
+# run benchmarks by the built-in python io engine, see pyio_engine.py
+# It needs only python interpreter on nodes
+
+
+ENGINE_DIR = "/tmp"
+
+
+def engine_source():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "pyio_engine.py")
+    with open(path) as fd:
+        return fd.read()
+
+
+def ensure_engine(executor):
+    """Copies engine to node, once per executor
+
+    :returns: engine path on node
+    """
+    path = getattr(executor, 'pyio_path', None)
+    if path is None:
+        data = engine_source()
+        digest = hashlib.sha256(data).hexdigest()
+        path = "{0}/pyio_engine-{1}.py".format(ENGINE_DIR, digest[:16])
+        deploy_binary(executor, data, digest, path)
+        executor.pyio_path = path
+    return path
+
+
+def pyio_cmd(python_path, engine_path, params, filename, timeout):
+    cmd = [python_path, engine_path,
+           "--rw", params.action,
+           "--bs", str(params.blocksize),
+           "--size", str(params.size),
+           "--iodepth", str(params.iodepth),
+           "--numjobs", str(params.concurence)]
+
+    if timeout is not None:
+        cmd.extend(("--timeout", str(timeout)))
+
+    if params.direct_io:
+        cmd.append("--direct")
+
+    if params.sync:
+        cmd.append("--sync")
+
+    cmd.append(filename)
+    return cmd
+
+
+def pyio_results(output, raw_out):
+    res = Results()
+    res.raw_output = raw_out
+    for field in 'bw_mean bw_dev bw_max bw_min bw_samples iops'.split():
+        setattr(res, field, output[field])
+
+    res.clat_hist = dict(output['clat_hist'])
+    res.update_lat_percentiles()
+    return res
+
+
+def parse_pyio_output(params, raw_out):
+    return pyio_results(json.loads(raw_out), raw_out)
+
+
+def run_pyio(executor, params, filename, timeout, python_path='python',
+             sync_obj=None):
+    if params.size is None:
+        raise ValueError("pyio engine requires io size")
+
+    engine_path = ensure_engine(executor)
+    cmd = pyio_cmd(python_path, engine_path, params, filename, timeout)
+
+    if sync_obj:
+        start_at = sync_obj.wait()
+        if start_at is not None:
+            delay = start_delay_ms(executor, start_at)
+            cmd.insert(2, "--startdelay={0}".format(delay))
+
+    raw_out = executor(cmd)
+    with PROFILER.span('parse'):
+        output = json.loads(raw_out)
+        res = pyio_results(output, raw_out)
+
+        start_ms = output['job_start'] - clock_offset(executor) * 1000
+        res.start_time = start_ms / 1000.0
+        res.end_time = (start_ms + output['runtime']) / 1000.0
+
+    return res
+
+
+def run_pyio_batch(executor, benchmarks, filename, timeout,
+                   python_path='python', sync_obj=None):
+    """Runs all benchmarks one by one
+
+    Nodes are synchronized only once, before the first benchmark.
+    """
+    results = []
+    for params in benchmarks:
+        results.append(run_pyio(executor, params, filename, timeout,
+                                python_path, sync_obj))
+        sync_obj = None
+    return results
@@ -0,0 +1,264 @@
+"""Dependency-free io engine, runs on benchmark nodes
+
+Is copied to nodes and started by `pyio.run_pyio`, so uses only the
+standard library and works with both python 2 and 3. Prints results as
+json to stdout.
+"""
+
+import os
+import io
+import sys
+import json
+import mmap
+import time
+import random
+import argparse
+import threading
+
+
+# latency histogram buckets keep 2 ** -HIST_BITS relative precision
+HIST_BITS = 6
+
+# bandwidth is sampled every BW_INTERVAL seconds
+BW_INTERVAL = 0.5
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+def hist_bucket(usec):
+    if usec < (1 << HIST_BITS):
+        return usec
+    shift = usec.bit_length() - HIST_BITS
+    return (usec >> shift) << shift
+
+
+class Job(object):
+    """Shared state of all workers
+
+    Sequential offsets are handed out by a shared counter, so queue of
+    `iodepth` workers goes through the file like a single stream.
+    """
+
+    def __init__(self, opts):
+        self.opts = opts
+        self.bsize = opts.bs * 1024
+        self.blocks = opts.size * 1024 // self.bsize
+        self.lock = threading.Lock()
+        self.next_block = 0
+        self.done_blocks = 0
+        self.stop_at = None
+        self.start = None
+
+    def next_offset(self, rnd):
+        if self.opts.rw in ('randread', 'randwrite'):
+            with self.lock:
+                if self.opts.timeout is None:
+                    if self.done_blocks >= self.blocks:
+                        return None
+                    self.done_blocks += 1
+            return rnd.randrange(self.blocks) * self.bsize
+
+        with self.lock:
+            if self.next_block >= self.blocks:
+                if self.opts.timeout is None:
+                    return None
+                self.next_block = 0
+            block = self.next_block
+            self.next_block += 1
+        return block * self.bsize
+
+
+def open_flags(opts):
+    flags = os.O_RDWR
+    if opts.direct:
+        flags |= getattr(os, 'O_DIRECT', 0)
+    if opts.sync:
+        flags |= getattr(os, 'O_SYNC', 0)
+    return flags
+
+
+def layout_file(opts):
+    "extends file to the benchmark size, like fio does"
+    size = opts.size * 1024
+    fd = os.open(opts.filename, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        cur_size = os.fstat(fd).st_size
+        if cur_size >= size:
+            return
+
+        chunk = 1024 * 1024
+        data = b'\0' * chunk
+        os.lseek(fd, cur_size, os.SEEK_SET)
+        while cur_size < size:
+            cur_size += os.write(fd, data[:min(chunk, size - cur_size)])
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Worker(threading.Thread):
+    """Emulates a single queue slot: synchronous io on its own fd
+
+    The buffer is allocated once, mmap memory is page-aligned, as
+    O_DIRECT requires. Python releases GIL during syscalls, so workers
+    keep up to `iodepth` requests in flight.
+    """
+
+    def __init__(self, job, seed):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.job = job
+        self.rnd = random.Random(seed)
+        self.hist = {}
+        self.bw_bytes = {}
+        self.error = None
+
+    def run(self):
+        job = self.job
+        is_write = job.opts.rw in ('write', 'randwrite')
+        buf = mmap.mmap(-1, job.bsize)
+        if is_write:
+            buf.write(os.urandom(job.bsize))
+
+        fd = os.open(job.opts.filename, open_flags(job.opts))
+        fobj = io.FileIO(fd, 'r+', closefd=False)
+        preadv = getattr(os, 'preadv', None)
+        pwritev = getattr(os, 'pwritev', None)
+        bsize = job.bsize
+        hist = self.hist
+        bw_bytes = self.bw_bytes
+
+        try:
+            while True:
+                offset = job.next_offset(self.rnd)
+                if offset is None:
+                    break
+
+                stime = clock()
+                if job.stop_at is not None and stime >= job.stop_at:
+                    break
+
+                if is_write:
+                    if pwritev is not None:
+                        done = pwritev(fd, [buf], offset)
+                    else:
+                        os.lseek(fd, offset, os.SEEK_SET)
+                        done = fobj.write(buf)
+                else:
+                    if preadv is not None:
+                        done = preadv(fd, [buf], offset)
+                    else:
+                        os.lseek(fd, offset, os.SEEK_SET)
+                        done = fobj.readinto(buf)
+
+                etime = clock()
+                if done != bsize:
+                    raise IOError("Short io {0} of {1} at {2}".format(
+                        done, bsize, offset))
+
+                bucket = hist_bucket(int((etime - stime) * 1e6))
+                hist[bucket] = hist.get(bucket, 0) + 1
+
+                interval = int((etime - job.start) / BW_INTERVAL)
+                bw_bytes[interval] = bw_bytes.get(interval, 0) + bsize
+        except Exception as exc:
+            self.error = repr(exc)
+        finally:
+            fobj.close()
+            os.close(fd)
+            buf.close()
+
+
+def mean_dev(values):
+    if not values:
+        return 0.0, 0.0
+    mean = float(sum(values)) / len(values)
+    if len(values) == 1:
+        return mean, 0.0
+    dev = (sum((val - mean) ** 2 for val in values) /
+           (len(values) - 1)) ** 0.5
+    return mean, dev
+
+
+def run_job(opts):
+    job = Job(opts)
+    workers = [Worker(job, idx) for idx in range(opts.numjobs * opts.iodepth)]
+
+    job_start = time.time()
+    job.start = clock()
+    if opts.timeout is not None:
+        job.stop_at = job.start + opts.timeout
+
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    runtime = clock() - job.start
+
+    errors = [worker.error for worker in workers if worker.error is not None]
+    if errors:
+        raise IOError(errors[0])
+
+    hist = {}
+    bw_bytes = {}
+    for worker in workers:
+        for bucket, count in worker.hist.items():
+            hist[bucket] = hist.get(bucket, 0) + count
+        for interval, count in worker.bw_bytes.items():
+            bw_bytes[interval] = bw_bytes.get(interval, 0) + count
+
+    # the last interval is incomplete
+    full_intervals = int(runtime / BW_INTERVAL)
+    samples = [bw_bytes.get(interval, 0) / 1024.0 / BW_INTERVAL
+               for interval in range(full_intervals)]
+    bw_mean, bw_dev = mean_dev(samples)
+
+    total_ios = sum(hist.values())
+    total_kb = total_ios * opts.bs
+    if not samples:
+        bw_mean = total_kb / runtime if runtime else 0.0
+        samples = [bw_mean]
+
+    return {'engine': 'pyio',
+            'rw': opts.rw,
+            'job_start': int(job_start * 1000),
+            'runtime': int(runtime * 1000),
+            'io_kbytes': total_kb,
+            'total_ios': total_ios,
+            'bw_mean': bw_mean,
+            'bw_dev': bw_dev,
+            'bw_max': max(samples),
+            'bw_min': min(samples),
+            'bw_samples': len(samples),
+            'iops': total_ios / runtime if runtime else 0.0,
+            'clat_hist': sorted(hist.items())}
+
+
+def _parse_args(args):
+    parser = argparse.ArgumentParser(description="Pure python io engine")
+    parser.add_argument("--rw", required=True,
+                        choices=['read', 'write', 'randread', 'randwrite'])
+    parser.add_argument("--bs", type=int, required=True, help="KiB")
+    parser.add_argument("--size", type=int, required=True, help="KiB")
+    parser.add_argument("--iodepth", type=int, default=1)
+    parser.add_argument("--numjobs", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=None)
+    parser.add_argument("--direct", action="store_true", default=False)
+    parser.add_argument("--sync", action="store_true", default=False)
+    parser.add_argument("--startdelay", type=float, default=0,
+                        help="msec to wait before io start")
+    parser.add_argument("filename")
+    return parser.parse_args(args)
+
+
+def main(args):
+    opts = _parse_args(args)
+    start_at = time.time() + opts.startdelay / 1000.0
+    layout_file(opts)
+    time.sleep(max(0, start_at - time.time()))
+    sys.stdout.write(json.dumps(run_job(opts)) + "\n")
+    return 0
+
+if __name__ == "__main__":
+    exit(main(sys.argv[1:]))
@@ -0,0 +1,380 @@
+import json
+import os.path
+import struct
+import hashlib
+import threading
+
+from fio import parse_fio_jobs, set_job_times, check_engine
+from fio import fio_engine_options
+from common import BenchmarkOption
+from deploy import deploy_binary
+from profiler import PROFILER
+from timesync import start_delay_ms
+
+# replay captured block io traces by fio read_iolog.
+# blktrace and fio iolog (v2, v3) traces are converted into iolog v3
+# (v2 for traces without timing) with offsets scaled to the target size,
+# every node gets its own log, which points to its target file
+
+
+LOG_DIR = "/tmp"
+
+# offsets are aligned to it after scaling
+REPLAY_ALIGN = 4096
+
+BLKTRACE_MAGIC = 0x65617400
+# magic, sequence, time, sector, bytes, action, pid, device, cpu, error,
+# pdu_len
+BLKTRACE_FMT = "IIQQIIIIIHH"
+BLKTRACE_SIZE = struct.calcsize("<" + BLKTRACE_FMT)
+
+BLK_TA_QUEUE = 1
+BLK_TC_WRITE = 1 << 1
+BLK_TC_DISCARD = 1 << 13
+
+IOLOG_ACTIONS = ('read', 'write', 'trim')
+
+
+class TraceIO(object):
+    __slots__ = ('time', 'action', 'offset', 'length')
+
+    def __init__(self, time, action, offset, length):
+        # nsec since trace start, None if trace has no timing
+        self.time = time
+        self.action = action
+        self.offset = offset
+        self.length = length
+
+
+def blktrace_endian(header):
+    for endian in "<>":
+        magic = struct.unpack(endian + "I", header[:4])[0]
+        if magic & 0xffffff00 == BLKTRACE_MAGIC:
+            return endian
+    return None
+
+
+def parse_blktrace(data):
+    "returns queued ios of binary blktrace (single, e.g. blkparse -d, file)"
+    endian = blktrace_endian(data[:4])
+    fmt = struct.Struct(endian + BLKTRACE_FMT)
+    ios = []
+    pos = 0
+    while pos + BLKTRACE_SIZE <= len(data):
+        (_, _, time, sector, nbytes, action, _, _, _, _,
+         pdu_len) = fmt.unpack_from(data, pos)
+        pos += BLKTRACE_SIZE + pdu_len
+
+        if action & 0xffff != BLK_TA_QUEUE or nbytes == 0:
+            continue
+
+        category = action >> 16
+        if category & BLK_TC_DISCARD:
+            kind = 'trim'
+        elif category & BLK_TC_WRITE:
+            kind = 'write'
+        else:
+            kind = 'read'
+        ios.append(TraceIO(time, kind, sector * 512, nbytes))
+
+    ios.sort(key=lambda io: io.time)
+    return ios
+
+
+def parse_iolog(data):
+    "returns read/write/trim ios of fio iolog v2 or v3"
+    lines = data.splitlines()
+    version = lines[0].strip() if lines else ""
+    if version not in ("fio version 2 iolog", "fio version 3 iolog"):
+        raise ValueError("Unknown iolog format {0!r}".format(version))
+    timed = version == "fio version 3 iolog"
+
+    ios = []
+    for line in lines[1:]:
+        parts = line.split()
+        if timed:
+            if len(parts) != 5:
+                continue
+            time, parts = int(parts[0]), parts[1:]
+        else:
+            if len(parts) != 4:
+                continue
+            time = None
+
+        if parts[1] in IOLOG_ACTIONS:
+            ios.append(TraceIO(time, parts[1], int(parts[2]), int(parts[3])))
+    return ios
+
+
+def read_trace(path):
+    "returns trace ios, timed ones start at zero"
+    with open(path, "rb") as fd:
+        data = fd.read()
+    if blktrace_endian(data[:4]) is not None:
+        ios = parse_blktrace(data)
+    else:
+        ios = parse_iolog(data)
+
+    if ios and ios[0].time is not None:
+        start = ios[0].time
+        for io in ios:
+            io.time -= start
+    return ios
+
+
+_traces = {}
+_traces_lock = threading.Lock()
+
+
+def load_trace(path):
+    "parses trace once per process"
+    with _traces_lock:
+        if path not in _traces:
+            _traces[path] = read_trace(path)
+        return _traces[path]
+
+
+def trace_summary(ios, speed=1.0):
+    """Returns what the trace did, timing is scaled by `speed`
+
+    'duration' (seconds), 'bw' (KiB/s) and 'iops' are None, if trace
+    has no timing.
+    """
+    kbytes = sum(io.length for io in ios) / 1024.0
+    summary = {'ios': len(ios), 'kbytes': kbytes,
+               'duration': None, 'bw': None, 'iops': None}
+
+    if ios and ios[-1].time is not None and ios[-1].time > 0:
+        duration = ios[-1].time / 1e9 / speed
+        summary['duration'] = duration
+        summary['bw'] = kbytes / duration
+        summary['iops'] = len(ios) / duration
+    return summary
+
+
+def trace_extent_kb(ios):
+    "trace address space size, KiB"
+    extent = max(io.offset + io.length for io in ios)
+    return (extent + 1023) // 1024
+
+
+def trace_blocksize(ios):
+    "the most frequent io size, KiB"
+    counts = {}
+    for io in ios:
+        counts[io.length] = counts.get(io.length, 0) + 1
+    length = max(counts.items(), key=lambda item: item[1])[0]
+    return max(1, length // 1024)
+
+
+def scale_offset(offset, length, extent, size, shift):
+    """Maps trace offset into the target of `size` bytes
+
+    Offsets are scaled linearly, then shifted by `shift` with wrapping,
+    so every node may access its own region of a shared device.
+    """
+    if length > size:
+        raise ValueError("Trace io of {0} bytes doesn't fit the target"
+                         .format(length))
+
+    offset = offset * size // extent + shift
+    offset = offset % size
+    offset -= offset % REPLAY_ALIGN
+    if offset + length > size:
+        offset = (size - length) - (size - length) % REPLAY_ALIGN
+    return offset
+
+
+def make_iolog(ios, filename, size_kb, shift_kb=0):
+    "returns iolog, which replays `ios` against `filename`"
+    timed = bool(ios) and ios[0].time is not None
+    extent = max(io.offset + io.length for io in ios)
+    size = size_kb * 1024
+    shift = shift_kb * 1024
+
+    lines = ["fio version {0} iolog".format(3 if timed else 2)]
+    prefix = "0 " if timed else ""
+    lines.append(prefix + filename + " add")
+    lines.append(prefix + filename + " open")
+
+    for io in ios:
+        line = "{0} {1} {2} {3}".format(
+            filename, io.action,
+            scale_offset(io.offset, io.length, extent, size, shift),
+            io.length)
+        if timed:
+            line = "{0} {1}".format(io.time, line)
+        lines.append(line)
+
+    last = "{0} ".format(ios[-1].time) if timed else ""
+    lines.append(last + filename + " close")
+    return "\n".join(lines) + "\n"
+
+
+def replay_benchmarks(trace_path, iodepths, speeds, size, no_stall=False,
+                      node_offset=None):
+    """Makes benchmarks, which replay the trace
+
+    :param size: target size in KiB, trace offsets are scaled into it.
+                 None - trace address space size, no scaling
+    :param node_offset: KiB, every next node replays shifted by it
+    """
+    ios = load_trace(trace_path)
+    if not ios:
+        raise ValueError("No io in trace {0!r}".format(trace_path))
+
+    if size is None:
+        size = trace_extent_kb(ios)
+
+    benchmarks = []
+    for iodepth in iodepths:
+        for speed in speeds:
+            # mixed action, reads and writes are summed up
+            bench = BenchmarkOption(1, iodepth, 'randrw',
+                                    trace_blocksize(ios), size)
+            bench.workload = "replay:{0}@{1:g}x".format(
+                os.path.basename(trace_path), speed)
+            bench.replay_trace = trace_path
+            bench.replay_speed = speed
+            bench.replay_no_stall = no_stall
+            bench.replay_node_offset = node_offset or 0
+            bench.replay_expected = trace_summary(ios, speed)
+            benchmarks.append(bench)
+    return benchmarks
+
+
+def set_replay_targets(benchmarks, executors):
+    "every node's position defines its offset shift"
+    targets = ["{0}:{1}".format(executor.node, filename)
+               for executor, filename in executors]
+    for bench in benchmarks:
+        bench.replay_targets = targets
+
+
+def node_shift_kb(executor, params, filename):
+    target = "{0}:{1}".format(executor.node, filename)
+    targets = params.replay_targets or [target]
+    idx = targets.index(target) if target in targets else 0
+    return idx * params.replay_node_offset
+
+
+def ship_iolog(executor, params, filename):
+    "copies node's iolog to it, returns remote path"
+    if params.size is None:
+        raise ValueError("Trace replay requires target size")
+
+    ios = load_trace(params.replay_trace)
+    data = make_iolog(ios, filename, params.size,
+                      node_shift_kb(executor, params, filename))
+    digest = hashlib.sha256(data).hexdigest()
+    path = "{0}/replay-{1}.iolog".format(LOG_DIR, digest[:16])
+    deploy_binary(executor, data, digest, path)
+    return path
+
+
+def replay_options(params, log_path):
+    opts = ["read_iolog={0}".format(log_path),
+            "replay_time_scale={0}".format(
+                int(round(params.replay_speed * 100)))]
+    if params.replay_no_stall:
+        opts.append("replay_no_stall=1")
+
+    opts.extend(fio_engine_options(params))
+    opts.append("iodepth={0}".format(params.iodepth))
+
+    if params.direct_io:
+        opts.append("direct=1")
+
+    if params.use_hight_io_priority:
+        opts.append("prio=0")
+
+    if params.use_threads:
+        opts.append("thread")
+
+    return opts
+
+
+def replay_comparison(expected, res, runtime):
+    """Compares replay with the original trace timing
+
+    :param runtime: replay duration, seconds
+    """
+    cmp = {'trace_bw': expected['bw'],
+           'trace_iops': expected['iops'],
+           'trace_duration': expected['duration'],
+           'duration': runtime,
+           'bw_ratio': None,
+           'iops_ratio': None,
+           'lag': None}
+
+    if expected['bw']:
+        cmp['bw_ratio'] = res.bw_mean / expected['bw']
+    if expected['iops']:
+        cmp['iops_ratio'] = res.iops / expected['iops']
+    if expected['duration'] is not None:
+        cmp['lag'] = runtime - expected['duration']
+    return cmp
+
+
+def job_runtime(job):
+    return max(job.get('read', {}).get('runtime', 0),
+               job.get('write', {}).get('runtime', 0)) / 1000.0
+
+
+def replay_results(benchmark, fio_output, raw_out):
+    jobs_output = fio_output["jobs"]
+    res = parse_fio_jobs(benchmark, jobs_output)
+    res.raw_output = raw_out
+
+    done_kb = sum(job.get(kind, {}).get('io_kbytes', 0)
+                  for job in jobs_output for kind in ('read', 'write', 'trim'))
+    runtime = max(job_runtime(job) for job in jobs_output)
+
+    res.replay = replay_comparison(benchmark.replay_expected, res, runtime)
+    expected_kb = benchmark.replay_expected['kbytes']
+    res.replay['done'] = done_kb * 100.0 / expected_kb if expected_kb else None
+    return res
+
+
+def parse_replay_output(benchmark, raw_out):
+    return replay_results(benchmark, json.loads(raw_out), raw_out)
+
+
+def run_replay(executor, params, filename, timeout, fio_path='fio',
+               sync_obj=None):
+    check_engine(executor, params, fio_path)
+
+    with PROFILER.span('transfer'):
+        log_path = ship_iolog(executor, params, filename)
+
+    cmd = [fio_path, "--name=replay", "--output-format=json+"]
+    if timeout is not None:
+        cmd.extend(("--timeout=%d" % timeout, "--runtime=%d" % timeout))
+    cmd.extend("--" + opt for opt in replay_options(params, log_path))
+
+    if sync_obj:
+        start_at = sync_obj.wait()
+        if start_at is not None:
+            delay = start_delay_ms(executor, start_at)
+            cmd.append("--startdelay={0}ms".format(delay))
+
+    raw_out = executor(cmd)
+    with PROFILER.span('parse'):
+        fio_output = json.loads(raw_out)
+        res = replay_results(params, fio_output, raw_out)
+        set_job_times(res, executor, fio_output, fio_output["jobs"])
+    return res
+
+
+def run_replay_batch(executor, benchmarks, filename, timeout, fio_path='fio',
+                     sync_obj=None):
+    """Replays all benchmarks one by one
+
+    Nodes are synchronized only once, before the first benchmark.
+    """
+    results = []
+    for params in benchmarks:
+        results.append(run_replay(executor, params, filename, timeout,
+                                  fio_path, sync_obj))
+        sync_obj = None
+    return results
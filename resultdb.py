@@ -0,0 +1,354 @@
+import sys
+import csv
+import json
+import time
+import uuid
+import sqlite3
+import argparse
+import threading
+
+from fio import parse_fio_output
+from iozone import parse_iozone_output
+from pyio import parse_pyio_output
+from replay import parse_replay_output
+from common import Results, BenchmarkOption, METRIC_FIELDS, result_engine
+
+
+DEFAULT_DB = "bench_results.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sweeps (
+    run_id TEXT PRIMARY KEY,
+    start_time REAL,
+    args TEXT
+);
+
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL REFERENCES sweeps(run_id),
+    node TEXT NOT NULL,
+    bench_type TEXT NOT NULL,
+    action TEXT NOT NULL,
+    blocksize INTEGER NOT NULL,
+    concurence INTEGER NOT NULL,
+    iodepth INTEGER NOT NULL,
+    parameters TEXT NOT NULL,
+    start_time REAL,
+    end_time REAL,
+    metrics TEXT,
+    raw_output TEXT
+);
+
+CREATE INDEX IF NOT EXISTS runs_bench_idx
+    ON runs (action, blocksize, iodepth, node);
+
+CREATE INDEX IF NOT EXISTS runs_run_id_idx ON runs (run_id);
+"""
+
+# columns, returned by query
+QUERY_COLUMNS = ('id', 'run_id', 'node', 'bench_type', 'action',
+                 'blocksize', 'concurence', 'iodepth', 'parameters',
+                 'start_time', 'end_time', 'metrics')
+
+
+def new_run_id():
+    return "{0}_{1}".format(time.strftime("%Y%m%d_%H%M%S"),
+                            uuid.uuid4().hex[:6])
+
+
+def results_metrics(res):
+    "returns json-serializable dict with all metrics of the `Results`"
+    metrics = dict((field, getattr(res, field)) for field in METRIC_FIELDS)
+    if res.clat_hist is not None:
+        metrics['clat_hist'] = sorted(res.clat_hist.items())
+    if res.telemetry is not None:
+        metrics['telemetry'] = res.telemetry
+    if res.replay is not None:
+        metrics['replay'] = res.replay
+    return metrics
+
+
+def metrics_to_results(row):
+    "makes `Results` from query row"
+    res = Results()
+    res.parameters = row['parameters']
+    res.type = row['parameters'].get('workload') or row['action']
+    res.block_size = row['blocksize']
+    res.concurence = row['concurence']
+    res.iodepth = row['iodepth']
+    res.ioengine = result_engine(row['bench_type'],
+                                 row['parameters'].get('ioengine', 'libaio'))
+    res.start_time = row['start_time']
+    res.end_time = row['end_time']
+
+    metrics = row['metrics'] or {}
+    for field in METRIC_FIELDS:
+        setattr(res, field, metrics.get(field))
+
+    if 'clat_hist' in metrics:
+        res.clat_hist = dict(metrics['clat_hist'])
+
+    res.telemetry = metrics.get('telemetry')
+    res.replay = metrics.get('replay')
+
+    return res
+
+
+# parameters, which are adjusted while benchmark runs
+VOLATILE_PARAMETERS = ('size', 'prepared')
+
+
+def benchmark_key(params):
+    "identifies benchmark of a sweep by its parameters dict"
+    return json.dumps(dict((name, val) for name, val in params.items()
+                           if name not in VOLATILE_PARAMETERS),
+                      sort_keys=True)
+
+
+def benchmark_from_parameters(params):
+    benchmark = BenchmarkOption(params['concurence'], params['iodepth'],
+                                params['action'], params['blocksize'],
+                                params['size'])
+    benchmark.__dict__.update(params)
+    return benchmark
+
+
+def parse_raw_output(bench_type, benchmark, raw_output):
+    if bench_type == 'fio':
+        return parse_fio_output(benchmark, raw_output)
+    elif bench_type == 'iozone':
+        return parse_iozone_output(benchmark, raw_output)
+    elif bench_type == 'pyio':
+        return parse_pyio_output(benchmark, raw_output)
+    elif bench_type == 'replay':
+        return parse_replay_output(benchmark, raw_output)
+    raise ValueError("Unknown benchmark type {0!r}".format(bench_type))
+
+
+class ResultsDB(object):
+    """SQLite-based storage of raw per-node benchmark results
+
+    Connection is shared between threads, all access is serialized.
+    """
+
+    def __init__(self, path=DEFAULT_DB):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def add_sweep(self, run_id, args):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO sweeps VALUES (?, ?, ?)",
+                (run_id, time.time(), json.dumps(args, default=repr)))
+
+    def add_run(self, run_id, node, bench_type, benchmark, res,
+                start_time, end_time):
+        params = json.dumps(benchmark.__dict__)
+        row = (run_id, node, bench_type, benchmark.action,
+               benchmark.blocksize, benchmark.concurence, benchmark.iodepth,
+               params, start_time, end_time,
+               json.dumps(results_metrics(res)), res.raw_output)
+
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO runs (run_id, node, bench_type, action, " +
+                "blocksize, concurence, iodepth, parameters, start_time, " +
+                "end_time, metrics, raw_output) " +
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+
+    def sweeps(self):
+        with self.lock:
+            cursor = self.conn.execute(
+                "SELECT run_id, start_time, args FROM sweeps " +
+                "ORDER BY start_time")
+            return [(run_id, stime, json.loads(args))
+                    for run_id, stime, args in cursor]
+
+    def query(self, run_id=None, action=None, blocksize=None, iodepth=None,
+              node=None, with_raw=False):
+        """Returns list of stored runs, matched all given filters
+
+        Every run is a dict with QUERY_COLUMNS keys, `parameters` and
+        `metrics` decoded from json. `raw_output` is added if `with_raw`.
+        """
+        columns = list(QUERY_COLUMNS)
+        if with_raw:
+            columns.append('raw_output')
+
+        conds = []
+        values = []
+        for name, val in (('run_id', run_id), ('action', action),
+                          ('blocksize', blocksize), ('iodepth', iodepth),
+                          ('node', node)):
+            if val is not None:
+                conds.append("{0} = ?".format(name))
+                values.append(val)
+
+        sql = "SELECT {0} FROM runs".format(", ".join(columns))
+        if conds:
+            sql += " WHERE " + " AND ".join(conds)
+        sql += " ORDER BY id"
+
+        with self.lock:
+            rows = [dict(zip(columns, row))
+                    for row in self.conn.execute(sql, values)]
+
+        for row in rows:
+            row['parameters'] = json.loads(row['parameters'])
+            if row['metrics'] is not None:
+                row['metrics'] = json.loads(row['metrics'])
+
+        return rows
+
+    def completed(self, run_id):
+        """Returns valid results of the sweep, stored so far
+
+        :returns: {benchmark_key: {node: [row]}}, failed runs are skipped
+        """
+        done = {}
+        for row in self.query(run_id=run_id):
+            if row['metrics'] is None or row['metrics'].get('bw_mean') is None:
+                continue
+            key = benchmark_key(row['parameters'])
+            done.setdefault(key, {}).setdefault(row['node'], []).append(row)
+        return done
+
+    def update_metrics(self, row_id, metrics):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE runs SET metrics = ? WHERE id = ?",
+                              (json.dumps(metrics), row_id))
+
+    def reparse(self, run_id=None):
+        """Recalculates metrics of stored runs from raw outputs
+
+        :returns: amount of updated runs
+        """
+        count = 0
+        for row in self.query(run_id=run_id, with_raw=True):
+            if row['raw_output'] is None:
+                continue
+
+            benchmark = benchmark_from_parameters(row['parameters'])
+            try:
+                res = parse_raw_output(row['bench_type'], benchmark,
+                                       row['raw_output'])
+            except Exception as exc:
+                print "Fail to parse run", row['id'], ":", exc
+                continue
+
+            # telemetry isn't a part of the raw output
+            if row['metrics'] is not None:
+                res.telemetry = row['metrics'].get('telemetry')
+
+            self.update_metrics(row['id'], results_metrics(res))
+            count += 1
+        return count
+
+
+class RunRecorder(object):
+    "stores node results of a single sweep into `ResultsDB`"
+
+    def __init__(self, db, run_id, bench_type):
+        self.db = db
+        self.run_id = run_id
+        self.bench_type = bench_type
+
+    def record(self, executor, benchmark, res, start_time, end_time):
+        self.db.add_run(self.run_id, executor.node, self.bench_type,
+                        benchmark, res, start_time, end_time)
+
+
+def _parse_db_args(args):
+    parser = argparse.ArgumentParser(
+        prog="bench.py", description="Query stored benchmark results")
+    subparsers = parser.add_subparsers(dest='command')
+
+    def add_common(subparser):
+        subparser.add_argument(
+            "--db", metavar="DB_PATH", default=DEFAULT_DB,
+            help="results database")
+        return subparser
+
+    def add_filters(subparser):
+        subparser.add_argument("--run-id", default=None)
+        subparser.add_argument("--action", default=None)
+        subparser.add_argument("--blocksize", type=int, default=None,
+                               help="block size in KiB")
+        subparser.add_argument("--iodepth", type=int, default=None)
+        subparser.add_argument("--node", default=None)
+        return subparser
+
+    add_common(subparsers.add_parser("runs", help="list stored sweeps"))
+
+    add_filters(add_common(subparsers.add_parser(
+        "query", help="print stored node results")))
+
+    export = add_filters(add_common(subparsers.add_parser(
+        "export", help="export stored node results")))
+    export.add_argument(
+        '-f', "--format", choices=['csv', 'json'], default='csv')
+    export.add_argument(
+        "--output", metavar="OUTPUT", type=argparse.FileType("w"),
+        default=sys.stdout)
+    export.add_argument(
+        "--raw", default=False, action="store_true",
+        help="include raw benchmark output")
+
+    reparse = add_common(subparsers.add_parser(
+        "reparse", help="recalculate metrics from stored raw outputs"))
+    reparse.add_argument("--run-id", default=None)
+
+    return parser.parse_args(args)
+
+
+def export_rows(rows, fmt, output):
+    if fmt == 'json':
+        json.dump(rows, output, indent=4)
+        output.write("\n")
+        return
+
+    columns = [col for col in QUERY_COLUMNS
+               if col not in ('parameters', 'metrics')]
+    columns += list(METRIC_FIELDS)
+    if rows and 'raw_output' in rows[0]:
+        columns.append('raw_output')
+
+    writer = csv.writer(output)
+    writer.writerow(columns)
+    for row in rows:
+        flat_row = dict(row)
+        flat_row.update(row['metrics'] or {})
+        writer.writerow([flat_row.get(col) for col in columns])
+
+
+def db_main(args):
+    args_obj = _parse_db_args(args)
+    db = ResultsDB(args_obj.db)
+
+    if args_obj.command == 'runs':
+        for run_id, stime, run_args in db.sweeps():
+            print run_id, time.ctime(stime), run_args.get('bench', '')
+
+    elif args_obj.command == 'query':
+        rows = db.query(args_obj.run_id, args_obj.action, args_obj.blocksize,
+                        args_obj.iodepth, args_obj.node)
+        for row in rows:
+            print row['run_id'], row['node'], metrics_to_results(row)
+
+    elif args_obj.command == 'export':
+        rows = db.query(args_obj.run_id, args_obj.action, args_obj.blocksize,
+                        args_obj.iodepth, args_obj.node,
+                        with_raw=args_obj.raw)
+        export_rows(rows, args_obj.format, args_obj.output)
+
+    elif args_obj.command == 'reparse':
+        print "Updated", db.reparse(args_obj.run_id), "runs"
+
+    db.close()
+    return 0
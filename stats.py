@@ -0,0 +1,314 @@
+# helpers to process statistical data, returned by benchmarks
+
+import math
+from array import array
+
+
+def fio_plat_idx_to_val(idx, plat_bits, plat_val):
+    "converts fio-2.x latency histogram bucket index to its value"
+    if idx < (plat_val << 1):
+        return idx
+
+    error_bits = (idx >> plat_bits) - 1
+    base = 1 << (error_bits + plat_bits)
+    k = idx % plat_val
+    return base + (k + 0.5) * (1 << error_bits)
+
+
+def parse_fio_clat_hist(raw_result):
+    """Returns completion latency histogram from fio json+ output
+
+    Histogram is a dict {latency_in_usec: io_count}. fio-3.x
+    provides `clat_ns` with bucket values in nanoseconds, while fio-2.x
+    provides `clat` with bucket indexes and latency in microseconds.
+    """
+
+    hist = {}
+
+    if 'clat_ns' in raw_result:
+        bins = raw_result['clat_ns'].get('bins', {})
+        for val, count in bins.items():
+            if count != 0:
+                usec = float(val) / 1000
+                hist[usec] = hist.get(usec, 0) + count
+        return hist
+
+    bins = raw_result.get('clat', {}).get('bins', {})
+    plat_bits = bins.get('FIO_IO_U_PLAT_BITS')
+    plat_val = bins.get('FIO_IO_U_PLAT_VAL')
+
+    for idx, count in bins.items():
+        if idx.startswith('FIO_') or count == 0:
+            continue
+
+        if plat_bits is not None:
+            usec = fio_plat_idx_to_val(int(idx), plat_bits, plat_val)
+        else:
+            usec = float(idx)
+
+        usec = float(usec)
+        hist[usec] = hist.get(usec, 0) + count
+
+    return hist
+
+
+def merge_histograms(*hists):
+    "sums io counts of the same buckets from several histograms"
+    res = {}
+    for hist in hists:
+        for val, count in hist.items():
+            res[val] = res.get(val, 0) + count
+    return res
+
+
+def hist_percentile(hist, percent):
+    "returns latency, which `percent` % of all io fit into"
+    total = sum(hist.values())
+    if total == 0:
+        return None
+
+    threshold = total * percent / 100.0
+    curr = 0
+    for val in sorted(hist):
+        curr += hist[val]
+        if curr >= threshold:
+            return val
+    return max(hist)
+
+
+class TimeSeries(object):
+    """Per-interval benchmark metrics, aligned on wall-clock time
+
+    Data is stored as array-backed columns rather than list of records
+    to keep long multi-node runs compact. `time` holds interval start in
+    epoch msec, `bw` - KiB/s, `iops` - io/s and `lat` - mean latency in usec.
+    """
+
+    columns = ('time', 'bw', 'iops', 'lat')
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.time = array('d')
+        self.bw = array('d')
+        self.iops = array('d')
+        self.lat = array('d')
+
+    def __len__(self):
+        return len(self.time)
+
+    def rows(self):
+        return zip(self.time, self.bw, self.iops, self.lat)
+
+    @classmethod
+    def from_buckets(cls, interval, buckets):
+        "buckets is a dict {bucket_no: (bw, iops, lat)}"
+        series = cls(interval)
+        for bucket_no in sorted(buckets):
+            bw, iops, lat = buckets[bucket_no]
+            series.time.append(bucket_no * interval)
+            series.bw.append(bw)
+            series.iops.append(iops)
+            series.lat.append(lat)
+        return series
+
+    def to_buckets(self):
+        return dict((int(tm // self.interval), (bw, iops, lat))
+                    for tm, bw, iops, lat in self.rows())
+
+
+def fio_log_to_buckets(job_logs, start_ms, interval):
+    """Sums per-job samples of fio logs, falling into the same interval
+
+    Every job gives a single sample per interval and direction. Record
+    times drift by a few msec, so they are rounded to the log interval,
+    records, which still meet in one interval, are averaged.
+
+    :param job_logs: lines of every job log,
+                     "time_msec, value, direction, bs, ..."
+    :param start_ms: job start time in epoch msec
+    :returns: dict {bucket_no: [sum_of_values, samples_count]}
+    """
+    buckets = {}
+    for lines in job_logs:
+        samples = {}
+        for line in lines:
+            items = line.split(',')
+            if len(items) < 2:
+                continue
+            slot = int(round(float(items[0]) / interval))
+            direction = items[2].strip() if len(items) > 2 else ''
+            samples.setdefault((slot, direction), []).append(float(items[1]))
+
+        for (slot, _), values in samples.items():
+            bucket_no = int((start_ms + slot * interval) // interval)
+            bucket = buckets.setdefault(bucket_no, [0.0, 0])
+            bucket[0] += sum(values) / len(values)
+            bucket[1] += 1
+    return buckets
+
+
+def merge_time_series(*series_list):
+    """Merges per-node time series into the cluster-wide one
+
+    Bandwidth and iops are summed, latency is averaged, weighted by iops.
+    """
+    series_list = [series for series in series_list if series is not None]
+    if len(series_list) == 0:
+        return None
+
+    interval = series_list[0].interval
+    buckets = {}
+    for series in series_list:
+        assert series.interval == interval
+        for bucket_no, (bw, iops, lat) in series.to_buckets().items():
+            sbw, siops, slat_sum = buckets.get(bucket_no, (0.0, 0.0, 0.0))
+            buckets[bucket_no] = (sbw + bw, siops + iops,
+                                  slat_sum + lat * iops)
+
+    for bucket_no, (bw, iops, lat_sum) in buckets.items():
+        buckets[bucket_no] = (bw, iops, lat_sum / iops if iops else 0.0)
+
+    return TimeSeries.from_buckets(interval, buckets)
+
+
+def _betacf(a, b, x, max_iter=200, eps=3e-14):
+    "continued fraction for incomplete beta function (Numerical Recipes)"
+    qab = a + b
+    qap = a + 1.0
+    qam = a - 1.0
+    c = 1.0
+    d = 1.0 - qab * x / qap
+    if abs(d) < 1e-300:
+        d = 1e-300
+    d = 1.0 / d
+    h = d
+    for m in range(1, max_iter + 1):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1.0 + aa * d
+        if abs(d) < 1e-300:
+            d = 1e-300
+        c = 1.0 + aa / c
+        if abs(c) < 1e-300:
+            c = 1e-300
+        d = 1.0 / d
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1.0 + aa * d
+        if abs(d) < 1e-300:
+            d = 1e-300
+        c = 1.0 + aa / c
+        if abs(c) < 1e-300:
+            c = 1e-300
+        d = 1.0 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.0) < eps:
+            break
+    return h
+
+
+def betainc(a, b, x):
+    "regularized incomplete beta function I_x(a, b)"
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+
+    lbeta = math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+    front = math.exp(lbeta + a * math.log(x) + b * math.log(1.0 - x))
+
+    if x < (a + 1.0) / (a + b + 2.0):
+        return front * _betacf(a, b, x) / a
+    return 1.0 - front * _betacf(b, a, 1.0 - x) / b
+
+
+def welch_ttest(mean1, dev1, n1, mean2, dev2, n2):
+    """Two-sided Welch's t-test for two samples, given by their stats
+
+    :returns: (t, p_value), p_value is None if it can't be calculated
+    """
+    if n1 < 2 or n2 < 2:
+        return None, None
+
+    var1 = float(dev1) ** 2 / n1
+    var2 = float(dev2) ** 2 / n2
+
+    if var1 + var2 == 0:
+        if mean1 == mean2:
+            return 0.0, 1.0
+        return float('inf'), 0.0
+
+    t = (mean2 - mean1) / math.sqrt(var1 + var2)
+    df = (var1 + var2) ** 2 / (var1 ** 2 / (n1 - 1) + var2 ** 2 / (n2 - 1))
+    p_value = betainc(df / 2.0, 0.5, df / (df + t ** 2))
+    return t, p_value
+
+
+def mean_dev(values):
+    "returns mean and sample standard deviation of values"
+    values = list(values)
+    mean = float(sum(values)) / len(values)
+    if len(values) < 2:
+        return mean, 0.0
+    var = sum((val - mean) ** 2 for val in values) / (len(values) - 1)
+    return mean, var ** 0.5
+
+
+def series_window_mean(series, start_ms, end_ms):
+    """Returns mean bw of intervals, which entirely fit into [start, end)
+
+    None if there is no such intervals.
+    """
+    bws = [bw for tm, bw in zip(series.time, series.bw)
+           if tm >= start_ms and tm + series.interval <= end_ms]
+    if len(bws) == 0:
+        return None
+    return sum(bws) / len(bws)
+
+
+def median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2 == 1:
+        return float(values[mid])
+    return (values[mid - 1] + values[mid]) / 2.0
+
+
+def mad(values):
+    "median absolute deviation"
+    med = median(values)
+    return median(abs(val - med) for val in values)
+
+
+# MAD floor as a fraction of median, nearly equal values give almost zero
+# MAD and any tiny deviation from the median would look like a straggler
+MIN_REL_MAD = 0.01
+
+
+def find_stragglers(node_values, k=3.0):
+    """Returns nodes, which value is more than k * MAD below the median
+
+    MAD is at least MIN_REL_MAD of the median.
+
+    :param node_values: list of (node, value)
+    """
+    values = [val for _, val in node_values]
+    med = median(values)
+    threshold = med - k * max(mad(values), MIN_REL_MAD * abs(med))
+    return [node for node, val in node_values if val < threshold]
+
+
+def jain_index(values):
+    """Jain's fairness index: 1 - all values are equal, 1/n - all
+    throughput goes to a single node"""
+    values = list(values)
+    sq_sum = sum(val ** 2 for val in values)
+    if sq_sum == 0:
+        return None
+    return float(sum(values)) ** 2 / (len(values) * sq_sum)
+
+
+def sum_dev(devs):
+    "standard deviation of sum of independent values"
+    return sum(dev ** 2 for dev in devs) ** 0.5
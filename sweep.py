@@ -0,0 +1,172 @@
+import copy
+import math
+
+
+class KneeSearch(object):
+    """Finds saturation point of a single benchmark dimension
+
+    Dimension (iodepth or concurence) value is doubled till throughput
+    gain of the doubling drops below `min_gain` percent or p99 latency
+    exceeds `max_lat` usec. Then the interval between the last good and
+    the first bad values is bisected. For a partial step the required gain
+    is scaled by log2 of the value ratio.
+
+    :param run_point: function, which runs a single `BenchmarkOption` and
+                      returns cluster `Results`
+    """
+
+    dimensions = ('iodepth', 'concurence')
+
+    def __init__(self, run_point, dimension='iodepth', min_gain=10.0,
+                 max_lat=None, max_value=256):
+        if dimension not in self.dimensions:
+            raise ValueError("Can't search over {0!r}".format(dimension))
+
+        self.run_point = run_point
+        self.dimension = dimension
+        self.min_gain = min_gain
+        self.max_lat = max_lat
+        self.max_value = max_value
+
+    def is_better(self, lo_val, lo_res, hi_val, hi_res):
+        "checks, that move from lo_val to hi_val is still worth it"
+        if hi_res.bw_mean is None:
+            return False
+
+        if self.max_lat is not None and hi_res.lat_p99 is not None and \
+                hi_res.lat_p99 > self.max_lat:
+            return False
+
+        # nothing to compare with, e.g. stalled or too short previous run
+        if lo_res is None or lo_res.bw_mean is None or lo_res.bw_mean <= 0:
+            return True
+
+        required = self.min_gain * math.log(float(hi_val) / lo_val, 2)
+        gain = (hi_res.bw_mean - lo_res.bw_mean) * 100.0 / lo_res.bw_mean
+        return gain >= required
+
+    def search(self, template):
+        """Yields `Results` of every measured point
+
+        Once done `self.knee` is (value, Results) of the saturation point,
+        (None, None) if even the first point is out of latency bound.
+        """
+        measured = {}
+
+        def measure(value):
+            benchmark = copy.copy(template)
+            setattr(benchmark, self.dimension, value)
+            measured[value] = self.run_point(benchmark)
+            return measured[value]
+
+        good_val, good_res = None, None
+        bad_val = None
+
+        value = 1
+        while value <= self.max_value:
+            res = measure(value)
+            yield res
+
+            if not self.is_better(good_val, good_res, value, res):
+                bad_val = value
+                break
+
+            good_val, good_res = value, res
+            value *= 2
+
+        if good_val is not None and bad_val is not None:
+            while bad_val - good_val > 1:
+                mid = (good_val + bad_val) // 2
+                res = measure(mid)
+                yield res
+
+                if self.is_better(good_val, good_res, mid, res):
+                    good_val, good_res = mid, res
+                else:
+                    bad_val = mid
+
+        self.knee = (good_val, good_res)
+
+
+def adaptive_sweep(run_point, templates, knees, **search_params):
+    """Runs `KneeSearch` for every benchmark template
+
+    Yields `Results` of all measured points, appends (template, value,
+    Results) of every found knee into `knees` list.
+    """
+    for template in templates:
+        searcher = KneeSearch(run_point, **search_params)
+        for res in searcher.search(template):
+            yield res
+        knees.append((template,) + searcher.knee)
+
+
+def format_knees(knees, dimension):
+    yield "Saturation points, found by {0} search:".format(dimension)
+    for template, value, res in knees:
+        descr = "{0} {1}".format(template.label, template.blocksize)
+        if res is None:
+            yield descr + " latency bound is exceeded at the first point"
+        else:
+            lat = "-" if res.lat_p99 is None else int(res.lat_p99)
+            yield "{0} {1}={2} bw={3} p99={4}us".format(
+                descr, dimension, value, int(res.bw_mean), lat)
+
+
+def scaling_counts(nodes, counts=None):
+    """Returns node counts for scaling sweep
+
+    Powers of two up to `nodes` (and `nodes` itself) by default.
+    """
+    if counts:
+        return sorted(set(count for count in counts if 0 < count <= nodes))
+
+    res = []
+    count = 1
+    while count < nodes:
+        res.append(count)
+        count *= 2
+    res.append(nodes)
+    return res
+
+
+def scaling_sweep(run_set, executors, counts, scaling):
+    """Runs benchmark set on growing subsets of executors
+
+    :param run_set: function, which runs the benchmark set on given
+                    executors and returns cluster `Results` iterator
+    Yields all `Results`, appends (nodes_count, Results) into `scaling`.
+    """
+    for count in counts:
+        print "Scaling sweep: running on", count, "node(s)"
+        for res in run_set(executors[:count]):
+            scaling.append((count, res))
+            yield res
+
+
+def format_scaling(scaling):
+    yield "Scaling: Type BlockSize Concurence Iodepth Engine Nodes BW " + \
+          "PerNodeBW Efficiency"
+
+    points = {}
+    for count, res in scaling:
+        key = (res.type, res.block_size, res.concurence, res.iodepth,
+               res.ioengine or "-")
+        points.setdefault(key, []).append((count, res))
+
+    for key in sorted(points):
+        baseline = None
+        for count, res in sorted(points[key], key=lambda point: point[0]):
+            if res.bw_mean is None:
+                yield " ".join(map(str, key + (count, "failed")))
+                continue
+
+            # nodes, which failed, give no throughput, but still count
+            per_node = float(res.bw_mean) / count
+            if baseline is None:
+                baseline = per_node
+
+            efficiency = per_node / baseline if baseline else 0.0
+            yield "{0} {1} {2} {3} {4} {5} {6} {7} {8:.1f}%".format(
+                *(key + (count, int(res.bw_mean), int(per_node),
+                         efficiency * 100)))
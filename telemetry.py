@@ -0,0 +1,191 @@
+import uuid
+import threading
+
+from timesync import clock_offset
+from profiler import PROFILER
+
+
+# single long-lived shell loop per node. Only `date` and `sleep` are
+# forked per sample, the rest are shell builtins and `cat`
+SAMPLER_SCRIPT = """
+while [ ! -e {stop} ]; do
+    echo "@ $(date +%s.%N)"
+    read -r line < /proc/stat; echo "$line"
+    cat /proc/diskstats
+    while read -r line; do
+        case "$line" in MemTotal:*|MemAvailable:*) echo "$line";; esac
+    done < /proc/meminfo
+    [ -r /proc/pressure/io ] && cat /proc/pressure/io
+    sleep {interval}
+done
+rm -f {stop}
+"""
+
+# /proc/stat cpu line fields
+CPU_FIELDS = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq',
+              'steal')
+
+# /proc/diskstats fields after device name
+DISK_READS, DISK_READ_TICKS, DISK_WRITES, DISK_WRITE_TICKS = 0, 3, 4, 7
+DISK_IO_TICKS = 9
+
+
+def parse_samples(output, offset=0.0):
+    """Parses sampler output
+
+    :param offset: node clock offset, sample times are converted into
+                   the local clock
+    :returns: list of samples, every sample is a dict with 'time', 'cpu',
+              'disks' ({device: [counters]}), 'mem' and 'io_pressure'
+              (total stall usec of 'some' tasks) keys
+    """
+    samples = []
+    sample = None
+    for line in output.splitlines():
+        parts = line.split()
+        if not parts:
+            continue
+
+        if parts[0] == '@':
+            # busybox date doesn't know %N
+            secs, _, nsecs = parts[1].partition('.')
+            stime = float(secs)
+            if nsecs.isdigit():
+                stime += float("0." + nsecs)
+            sample = {'time': stime - offset, 'cpu': None, 'disks': {},
+                      'mem': {}, 'io_pressure': None}
+            samples.append(sample)
+        elif sample is None:
+            continue
+        elif parts[0] == 'cpu':
+            sample['cpu'] = dict(zip(CPU_FIELDS, map(int, parts[1:])))
+        elif parts[0].isdigit() and len(parts) >= 14:
+            sample['disks'][parts[2]] = map(int, parts[3:])
+        elif parts[0] in ('MemTotal:', 'MemAvailable:'):
+            sample['mem'][parts[0][:-1]] = int(parts[1])
+        elif parts[0] == 'some':
+            for field in parts[1:]:
+                name, _, val = field.partition('=')
+                if name == 'total':
+                    sample['io_pressure'] = int(val)
+
+    # the last sample may be cut by sampler stop
+    if samples and (samples[-1]['cpu'] is None or
+                    not samples[-1]['disks']):
+        samples.pop()
+    return samples
+
+
+def window_samples(samples, start, end):
+    "returns samples, which cover [start, end] interval"
+    first = None
+    last = None
+    for idx, sample in enumerate(samples):
+        if sample['time'] <= start or first is None:
+            first = idx
+        if last is None and sample['time'] >= end:
+            last = idx
+    if last is None:
+        last = len(samples) - 1
+    return samples[first:last + 1]
+
+
+def summarize(samples, start=None, end=None):
+    """Returns telemetry summary for [start, end] interval
+
+    Summary is a dict with busiest device name and its utilization
+    (percents) and await (msec), cpu 'iowait', 'sys' and 'steal'
+    percents, 'io_pressure' (percent of time some tasks were stalled on
+    io) and minimal available memory in MiB.
+    None, if there are less than two samples.
+    """
+    if start is not None and end is not None:
+        samples = window_samples(samples, start, end)
+
+    if len(samples) < 2:
+        return None
+
+    first, last = samples[0], samples[-1]
+    duration = last['time'] - first['time']
+    if duration <= 0:
+        return None
+
+    summary = {'device': None, 'util': None, 'await': None}
+
+    best_ticks = -1
+    for dev, counters in last['disks'].items():
+        if dev not in first['disks']:
+            continue
+        delta = [new - old for new, old in zip(counters, first['disks'][dev])]
+        if delta[DISK_IO_TICKS] <= best_ticks:
+            continue
+
+        best_ticks = delta[DISK_IO_TICKS]
+        ios = delta[DISK_READS] + delta[DISK_WRITES]
+        ticks = delta[DISK_READ_TICKS] + delta[DISK_WRITE_TICKS]
+        summary['device'] = dev
+        summary['util'] = min(100.0, delta[DISK_IO_TICKS] /
+                              (duration * 10.0))
+        summary['await'] = float(ticks) / ios if ios else None
+
+    cpu_delta = dict((name, last['cpu'].get(name, 0) -
+                      first['cpu'].get(name, 0)) for name in CPU_FIELDS)
+    cpu_total = sum(cpu_delta.values())
+    for name, field in (('iowait', 'iowait'), ('sys', 'system'),
+                        ('steal', 'steal')):
+        summary[name] = cpu_delta[field] * 100.0 / cpu_total \
+            if cpu_total else None
+
+    if first['io_pressure'] is not None and last['io_pressure'] is not None:
+        summary['io_pressure'] = min(100.0, (last['io_pressure'] -
+                                             first['io_pressure']) /
+                                     (duration * 1e4))
+    else:
+        summary['io_pressure'] = None
+
+    avail = [sample['mem']['MemAvailable'] for sample in samples
+             if 'MemAvailable' in sample['mem']]
+    summary['mem_avail_mb'] = min(avail) // 1024 if avail else None
+
+    return summary
+
+
+class TelemetrySampler(object):
+    """Samples node counters by a single long-lived process
+
+    Usage: `start()` before the benchmark, `stop()` after it, then
+    `summarize(start, end)` for every benchmark window.
+    """
+
+    def __init__(self, executor, interval=1.0):
+        self.executor = executor
+        self.interval = interval
+        self.stop_path = "/tmp/telemetry_{0}.stop".format(uuid.uuid4().hex)
+        self.output = []
+        self.samples = []
+        self.thread = None
+
+    def _run(self):
+        script = SAMPLER_SCRIPT.format(stop=self.stop_path,
+                                       interval=self.interval)
+        try:
+            with PROFILER.bind(self.executor.node, 'telemetry'):
+                self.executor.run(["sh", "-c", script],
+                                  out_cb=self.output.append)
+        except Exception as exc:
+            print "Telemetry sampler on", self.executor.node, "fails:", exc
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.executor.run(["touch", self.stop_path])
+        self.thread.join(self.interval * 2 + 30)
+        self.samples = parse_samples("".join(self.output),
+                                     clock_offset(self.executor))
+        return self.samples
+
+    def summarize(self, start=None, end=None):
+        return summarize(self.samples, start, end)
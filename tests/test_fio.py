@@ -0,0 +1,28 @@
+import unittest
+
+from common import BenchmarkOption
+from fio import parse_fio_job
+
+
+class FioJobTest(unittest.TestCase):
+    def job(self, read_bw, write_bw):
+        def part(bw):
+            return {'bw_mean': bw, 'bw_dev': 3.0, 'bw_max': bw, 'bw_min': bw,
+                    'iops': bw / 4.0, 'bw_samples': 10,
+                    'clat_ns': {'bins': {'1000': 1}}}
+        return {'read': part(read_bw), 'write': part(write_bw)}
+
+    def test_mixed(self):
+        bench = BenchmarkOption(1, 1, 'randrw', 4, 1024)
+        res = parse_fio_job(bench, self.job(300.0, 100.0))
+        self.assertEqual(res.bw_mean, 400.0)
+        self.assertEqual(res.clat_hist, {1.0: 2})
+
+    def test_write(self):
+        bench = BenchmarkOption(1, 1, 'randwrite', 4, 1024)
+        self.assertEqual(parse_fio_job(bench, self.job(0.0, 100.0)).bw_mean,
+                         100.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+from common import BenchmarkOption
+from iozone import parse_iozone_output, iozone_invocations, iozone_cmd
+
+
+class IOZoneThroughputTest(unittest.TestCase):
+    output = ("\tChildren see throughput for  2 initial writers \t=  "
+              "100.00 KB/sec\n"
+              "\tChildren see throughput for  2 readers \t\t=  "
+              "300.50 KB/sec\n"
+              "\tChildren see throughput for 2 re-readers \t=  "
+              "310.00 KB/sec\n")
+
+    def test_readers(self):
+        bench = BenchmarkOption(2, 1, 'read', 4, 1024)
+        self.assertEqual(parse_iozone_output(bench, self.output).bw_mean, 300)
+        bench.action = 'reread'
+        self.assertEqual(parse_iozone_output(bench, self.output).bw_mean, 310)
+
+    def test_no_throughput_mode_output(self):
+        bench = BenchmarkOption(2, 1, 'recrewrite', 4, 1024)
+        self.assertRaises(ValueError, iozone_invocations, [bench])
+        bench.concurence = 1
+        self.assertEqual(len(iozone_invocations([bench])), 1)
+
+
+class IOZoneCmdTest(unittest.TestCase):
+    def test_unprepared_file_is_written_first(self):
+        bench = BenchmarkOption(1, 1, 'read', 4, 1024)
+        cmd = iozone_cmd('iozone', bench, '/tmp/f', ['1'])
+        self.assertEqual(cmd[-4:], ['-i', '0', '-i', '1'])
+        self.assertNotIn('-w', cmd)
+
+    def test_prepared_file_is_kept(self):
+        bench = BenchmarkOption(1, 1, 'read', 4, 1024)
+        bench.prepared = True
+        cmd = iozone_cmd('iozone', bench, '/tmp/f', ['1'])
+        self.assertEqual(cmd[-3:], ['-w', '-i', '1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
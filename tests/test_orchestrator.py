@@ -0,0 +1,26 @@
+import threading
+import unittest
+
+from orchestrator import Barrier
+
+
+class BarrierTest(unittest.TestCase):
+    def test_release_unblocks_waiters(self):
+        barrier = Barrier(2)
+        waiter = threading.Thread(target=barrier.wait)
+        waiter.daemon = True
+        waiter.start()
+
+        barrier.release()
+        waiter.join(5)
+        self.assertFalse(waiter.is_alive())
+
+    def test_release_after_wait(self):
+        barrier = Barrier(1)
+        barrier.wait()
+        barrier.release()
+        self.assertEqual(barrier.counter, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import struct
+import unittest
+
+from replay import parse_iolog, parse_blktrace, scale_offset, make_iolog
+from replay import trace_summary, TraceIO, BLKTRACE_FMT
+
+
+class ReplayTest(unittest.TestCase):
+    def test_iolog_v2(self):
+        ios = parse_iolog("fio version 2 iolog\n/dev/sdb add\n"
+                          "/dev/sdb open\n/dev/sdb read 4096 512\n"
+                          "/dev/sdb sync 0 0\n/dev/sdb write 0 8192\n"
+                          "/dev/sdb close\n")
+        self.assertEqual([(io.time, io.action, io.offset, io.length)
+                          for io in ios],
+                         [(None, 'read', 4096, 512), (None, 'write', 0, 8192)])
+
+    def test_iolog_v3(self):
+        ios = parse_iolog("fio version 3 iolog\n0 /dev/sdb add\n"
+                          "100 /dev/sdb read 0 4096\n"
+                          "2000000100 /dev/sdb write 4096 4096\n")
+        self.assertEqual([io.time for io in ios], [100, 2000000100])
+
+    def test_unknown_iolog(self):
+        self.assertRaises(ValueError, parse_iolog, "garbage\n")
+
+    def test_blktrace(self):
+        queue_write = 1 | (2 << 16)
+        complete_read = 8 | (1 << 16)
+        data = struct.pack("<" + BLKTRACE_FMT, 0x65617407, 0, 5000, 16,
+                           8192, queue_write, 1, 0, 0, 0, 4) + "pdu!"
+        data += struct.pack("<" + BLKTRACE_FMT, 0x65617407, 1, 6000, 16,
+                            8192, complete_read, 1, 0, 0, 0, 0)
+        ios = parse_blktrace(data)
+        self.assertEqual([(io.time, io.action, io.offset, io.length)
+                          for io in ios], [(5000, 'write', 8192, 8192)])
+
+    def test_summary(self):
+        ios = [TraceIO(0, 'read', 0, 4096), TraceIO(10 ** 9, 'write', 0, 4096)]
+        summary = trace_summary(ios, speed=2.0)
+        self.assertAlmostEqual(summary['duration'], 0.5)
+        self.assertAlmostEqual(summary['bw'], 16.0)
+        self.assertIsNone(trace_summary([TraceIO(None, 'read', 0, 1)])['bw'])
+
+    def test_scale_offset(self):
+        size = 1024 * 1024
+        self.assertEqual(scale_offset(0, 4096, 4 * size, size, 0), 0)
+        self.assertEqual(scale_offset(2 * size, 4096, 4 * size, size, 0),
+                         size // 2)
+        # shifted io still fits the target
+        offset = scale_offset(4 * size - 4096, 4096, 4 * size, size, 8192)
+        self.assertTrue(0 <= offset <= size - 4096)
+        self.assertEqual(offset % 4096, 0)
+
+    def test_make_iolog(self):
+        ios = [TraceIO(0, 'read', 0, 4096), TraceIO(500, 'write', 8192, 4096)]
+        log = make_iolog(ios, "/tmp/x", 1024, shift_kb=4).splitlines()
+        self.assertEqual(log[0], "fio version 3 iolog")
+        self.assertEqual(log[3], "0 /tmp/x read 4096 4096")
+        self.assertEqual(log[-1], "500 /tmp/x close")
+
+
+if __name__ == '__main__':
+    unittest.main()
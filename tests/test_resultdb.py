@@ -0,0 +1,51 @@
+import unittest
+
+from common import BenchmarkOption
+from resultdb import benchmark_key, metrics_to_results
+
+
+class BenchmarkKeyTest(unittest.TestCase):
+    def test_volatile_parameters(self):
+        bench = BenchmarkOption(1, 8, 'read', 4, 1024)
+        key = benchmark_key(bench.__dict__)
+        bench.size = 4096
+        bench.prepared = True
+        self.assertEqual(benchmark_key(bench.__dict__), key)
+        bench.iodepth = 16
+        self.assertNotEqual(benchmark_key(bench.__dict__), key)
+
+    def test_list_parameters(self):
+        first = BenchmarkOption(1, 8, 'read', 4, 1024)
+        second = BenchmarkOption(1, 8, 'read', 4, 1024)
+        first.engine_options = ['hipri']
+        second.engine_options = ['hipri']
+        self.assertEqual(set([benchmark_key(first.__dict__),
+                              benchmark_key(second.__dict__)]),
+                         set([benchmark_key(first.__dict__)]))
+
+
+def make_row(bench_type, **params):
+    return {'node': 'n1', 'bench_type': bench_type, 'action': 'read',
+            'blocksize': 4, 'concurence': 1, 'iodepth': 8,
+            'parameters': params, 'start_time': None, 'end_time': None,
+            'metrics': {'bw_mean': 100}}
+
+
+class MetricsToResultsTest(unittest.TestCase):
+    def test_engine(self):
+        self.assertEqual(metrics_to_results(
+            make_row('fio', ioengine='io_uring')).ioengine, 'io_uring')
+        self.assertEqual(metrics_to_results(
+            make_row('pyio', ioengine='libaio')).ioengine, 'pyio')
+        self.assertIsNone(metrics_to_results(
+            make_row('iozone', ioengine='libaio')).ioengine)
+
+    def test_times(self):
+        row = make_row('fio')
+        row['start_time'], row['end_time'] = 10.0, 20.0
+        res = metrics_to_results(row)
+        self.assertEqual((res.start_time, res.end_time), (10.0, 20.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+
+from stats import hist_percentile, merge_histograms, parse_fio_clat_hist
+from stats import welch_ttest, fio_log_to_buckets, jain_index
+from stats import find_stragglers, sum_dev
+
+
+class HistogramTest(unittest.TestCase):
+    def test_percentile(self):
+        hist = {10: 50, 20: 40, 100: 9, 1000: 1}
+        self.assertEqual(hist_percentile(hist, 50), 10)
+        self.assertEqual(hist_percentile(hist, 90), 20)
+        self.assertEqual(hist_percentile(hist, 99), 100)
+        self.assertEqual(hist_percentile(hist, 99.99), 1000)
+
+    def test_percentile_empty(self):
+        self.assertIsNone(hist_percentile({}, 99))
+
+    def test_merge(self):
+        self.assertEqual(merge_histograms({1: 2, 5: 1}, {5: 3, 7: 1}),
+                         {1: 2, 5: 4, 7: 1})
+
+    def test_fio3_clat_ns(self):
+        raw = {'clat_ns': {'bins': {'2000': 3, '5000': 0, '8000': 1}}}
+        self.assertEqual(parse_fio_clat_hist(raw), {2.0: 3, 8.0: 1})
+
+
+class WelchTest(unittest.TestCase):
+    def test_known_p_value(self):
+        t, p_value = welch_ttest(10.0, 2.0, 10, 12.0, 2.0, 10)
+        self.assertAlmostEqual(t, 2.236, places=3)
+        self.assertAlmostEqual(p_value, 0.038, places=3)
+
+    def test_same_samples(self):
+        t, p_value = welch_ttest(10.0, 1.0, 5, 10.0, 1.0, 5)
+        self.assertEqual(t, 0.0)
+        self.assertAlmostEqual(p_value, 1.0)
+
+    def test_too_few_samples(self):
+        self.assertEqual(welch_ttest(1.0, 0.1, 1, 2.0, 0.1, 5),
+                         (None, None))
+
+
+class FioLogBucketsTest(unittest.TestCase):
+    def test_drifting_records(self):
+        # the second record drifts into the first absolute bucket
+        job = ["1000, 100, 0, 4096", "1998, 110, 0, 4096",
+               "3003, 120, 0, 4096"]
+        buckets = fio_log_to_buckets([job], 500, 1000)
+        self.assertEqual(sorted(buckets), [1, 2, 3])
+        self.assertEqual([buckets[no][0] for no in (1, 2, 3)],
+                         [100.0, 110.0, 120.0])
+
+    def test_jobs_are_summed(self):
+        jobs = [["1000, 100, 0, 4096", "2000, 100, 0, 4096"],
+                ["1004, 50, 0, 4096", "1996, 70, 0, 4096"]]
+        buckets = fio_log_to_buckets(jobs, 0, 1000)
+        self.assertEqual(buckets, {1: [150.0, 2], 2: [170.0, 2]})
+
+    def test_directions_of_a_job(self):
+        job = ["1000, 70, 0, 4096", "1000, 30, 1, 4096"]
+        self.assertEqual(fio_log_to_buckets([job], 0, 1000), {1: [100.0, 2]})
+
+    def test_records_of_one_interval_are_averaged(self):
+        job = ["1000, 100, 0, 4096", "1100, 200, 0, 4096"]
+        self.assertEqual(fio_log_to_buckets([job], 0, 1000), {1: [150.0, 1]})
+
+
+class ClusterStatsTest(unittest.TestCase):
+    def test_jain_index(self):
+        self.assertAlmostEqual(jain_index([5, 5, 5, 5]), 1.0)
+        self.assertAlmostEqual(jain_index([8, 0, 0, 0]), 0.25)
+        self.assertIsNone(jain_index([0, 0]))
+
+    def test_stragglers(self):
+        nodes = [('a', 100), ('b', 101), ('c', 99), ('d', 100), ('e', 40)]
+        self.assertEqual(find_stragglers(nodes), ['e'])
+
+    def test_no_stragglers_of_equal_nodes(self):
+        nodes = [('a', 100), ('b', 100), ('c', 99.5)]
+        self.assertEqual(find_stragglers(nodes), [])
+
+    def test_sum_dev(self):
+        self.assertAlmostEqual(sum_dev([3, 4]), 5.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+from common import BenchmarkOption, Results
+from sweep import KneeSearch
+
+
+def curve_runner(bw_of, lat_of=None):
+    "returns run_point, which reports bw_of(iodepth), and its call log"
+    calls = []
+
+    def run_point(benchmark):
+        calls.append(benchmark.iodepth)
+        res = Results()
+        res.bw_mean = bw_of(benchmark.iodepth)
+        if lat_of is not None:
+            res.lat_p99 = lat_of(benchmark.iodepth)
+        return res
+
+    return run_point, calls
+
+
+class KneeSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.template = BenchmarkOption(1, 1, 'randread', 4, 1024)
+
+    def search(self, run_point, **params):
+        searcher = KneeSearch(run_point, **params)
+        list(searcher.search(self.template))
+        return searcher.knee
+
+    def test_saturation(self):
+        run_point, calls = curve_runner(lambda depth: min(depth, 8) * 100.0)
+        value, res = self.search(run_point, max_value=64)
+        self.assertEqual(value, 8)
+        self.assertEqual(res.bw_mean, 800.0)
+        self.assertEqual(calls[:5], [1, 2, 4, 8, 16])
+
+    def test_bisection(self):
+        run_point, calls = curve_runner(lambda depth: depth * 100.0,
+                                        lambda depth: depth * 1000.0)
+        value, _ = self.search(run_point, max_value=64, max_lat=6500)
+        self.assertEqual(value, 6)
+        self.assertEqual(calls, [1, 2, 4, 8, 6, 7])
+
+    def test_max_value(self):
+        run_point, _ = curve_runner(lambda depth: depth * 100.0)
+        value, _ = self.search(run_point, max_value=16)
+        self.assertEqual(value, 16)
+
+    def test_latency_bound(self):
+        run_point, _ = curve_runner(lambda depth: depth * 100.0,
+                                    lambda depth: depth * 1000.0)
+        value, _ = self.search(run_point, max_value=64, max_lat=4000)
+        self.assertEqual(value, 4)
+
+    def test_latency_bound_at_first_point(self):
+        run_point, _ = curve_runner(lambda depth: 100.0,
+                                    lambda depth: 10000.0)
+        self.assertEqual(self.search(run_point, max_lat=1000), (None, None))
+
+    def test_zero_bandwidth_step(self):
+        run_point, _ = curve_runner(lambda depth: 0.0 if depth == 1 else
+                                    min(depth, 4) * 100.0)
+        value, _ = self.search(run_point, max_value=64)
+        self.assertEqual(value, 4)
+
+    def test_unknown_dimension(self):
+        self.assertRaises(ValueError, KneeSearch, None, dimension='bs')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+from workloads import load_workloads, workload_benchmarks, parse_bssplit
+from workloads import size_kb
+
+
+def write_temp(data):
+    fd, path = tempfile.mkstemp()
+    os.write(fd, data)
+    os.close(fd)
+    return path
+
+
+class WorkloadsTest(unittest.TestCase):
+    def load(self, text):
+        path = write_temp(text)
+        try:
+            return load_workloads(path)
+        finally:
+            os.unlink(path)
+
+    def test_load(self):
+        workloads = self.load("[oltp]\nrw = randrw\nrwmixread = 70\n"
+                              "bssplit = 8k/70:64k/30\niodepth = 16\n\n"
+                              "[log]\nrw = write\nblocksize = 4k\n")
+        self.assertEqual([name for name, _ in workloads], ['oltp', 'log'])
+
+        benchmarks = workload_benchmarks(workloads, [1, 2], [4], 1024)
+        oltp = [bench for bench in benchmarks if bench.workload == 'oltp']
+        log = [bench for bench in benchmarks if bench.workload == 'log']
+
+        self.assertEqual([bench.iodepth for bench in oltp], [16, 16])
+        self.assertEqual([bench.concurence for bench in log], [1, 2])
+        self.assertEqual(oltp[0].blocksize, 8)
+        self.assertEqual(oltp[0].label, 'oltp')
+        self.assertEqual(oltp[0].workload_options,
+                         ['rwmixread=70', 'bssplit=8k/70:64k/30'])
+
+    def test_unknown_option(self):
+        self.assertRaises(ValueError, self.load,
+                          "[x]\nrw = read\nblocksize = 4k\nbogus = 1\n")
+
+    def test_bad_rw(self):
+        self.assertRaises(ValueError, self.load,
+                          "[x]\nrw = append\nblocksize = 4k\n")
+
+    def test_bssplit(self):
+        self.assertEqual(parse_bssplit("4k/60:1m/40"),
+                         [(4, 60), (1024, 40)])
+        self.assertEqual(parse_bssplit("4096/50:8kb/50"),
+                         [(4, 50), (8, 50)])
+
+    def test_size_kb(self):
+        self.assertEqual(size_kb("512k"), 512)
+        self.assertEqual(size_kb("8192"), 8)
+        self.assertEqual(size_kb("2g"), 2 * 1024 ** 2)
+        self.assertRaises(ValueError, size_kb, "512")
+        self.assertRaises(ValueError, size_kb, "4x")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import time
+import threading
+
+from orchestrator import Barrier
+
+
+def measure_clock_offset(executor, probes=5):
+    """Estimates node clock offset relatively to the local clock
+
+    Offset of the probe with the smallest round trip is used.
+    :returns: (offset, rtt) in seconds, offset is remote - local
+    """
+    best = None
+    for _ in range(probes):
+        t0 = time.time()
+        code, out, _ = executor.run(["date", "+%s.%N"])
+        t1 = time.time()
+
+        if code != 0:
+            continue
+
+        # busybox date doesn't know %N
+        secs, _, nsecs = out.strip().partition('.')
+        remote = float(secs)
+        if nsecs.isdigit():
+            remote += float("0." + nsecs)
+
+        rtt = t1 - t0
+        if best is None or rtt < best[1]:
+            best = (remote - (t0 + t1) / 2, rtt)
+
+    if best is None:
+        raise RuntimeError("Can't get time from {0}".format(executor.node))
+
+    return best
+
+
+def sync_clocks(executors):
+    """Measures clock offset of all executors in parallel
+
+    Stores it into executor `clock_offset` and `clock_rtt` attributes.
+    """
+    def measure(executor):
+        try:
+            executor.clock_offset, executor.clock_rtt = \
+                measure_clock_offset(executor)
+        except Exception as exc:
+            print "Fail to measure clock offset of", executor.node, exc
+
+    threads = []
+    for executor in executors:
+        th = threading.Thread(target=measure, args=(executor,))
+        th.daemon = True
+        threads.append(th)
+        th.start()
+
+    for th in threads:
+        th.join()
+
+
+def clock_offset(executor):
+    return getattr(executor, 'clock_offset', 0.0)
+
+
+class TimedStart(Barrier):
+    """Barrier, which also agrees on a common absolute start time
+
+    `wait` returns local timestamp, when all nodes should start io. It is
+    `lead` seconds after the last node reached the barrier, so slow
+    command launches and benchmark preparation fit into it.
+    """
+
+    def __init__(self, counter, lead=5.0):
+        Barrier.__init__(self, counter)
+        self.lead = lead
+        self.start_at = None
+
+    def wait(self):
+        Barrier.wait(self)
+        with self.c_lock:
+            if self.start_at is None:
+                self.start_at = time.time() + self.lead
+        return self.start_at
+
+
+def start_delay_ms(executor, start_at):
+    "returns delay, after which the command, launched now, should start io"
+    one_way = getattr(executor, 'clock_rtt', 0.0) / 2
+    return max(0, int((start_at - time.time() - one_way) * 1000))
+
+
+def overlap_window(node_times):
+    """Returns (start, end) of interval, when all nodes were active
+
+    :param node_times: list of (node, start, end)
+    :returns: None, if nodes were never active simultaneously
+    """
+    start = max(stime for _, stime, _ in node_times)
+    end = min(etime for _, _, etime in node_times)
+    if end <= start:
+        return None
+    return start, end
+
+
+def start_skew(node_times):
+    "returns list of (node, seconds), which node started after the first one"
+    first = min(stime for _, stime, _ in node_times)
+    return [(node, stime - first) for node, stime, _ in node_times]
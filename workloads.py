@@ -0,0 +1,124 @@
+import ConfigParser
+
+from common import BenchmarkOption
+
+
+# fio rw modes, a workload may use
+WORKLOAD_RW = ('read', 'write', 'randread', 'randwrite', 'rw', 'readwrite',
+               'randrw')
+
+# workload file keys, which are passed to fio as is
+FIO_WORKLOAD_KEYS = ('rwmixread', 'rwmixwrite', 'bssplit',
+                     'random_distribution', 'percentage_random',
+                     'thinktime', 'thinktime_spin', 'thinktime_blocks',
+                     'fsync', 'fdatasync', 'rate_iops', 'rate')
+
+# keys, which become BenchmarkOption attributes
+BENCHMARK_KEYS = ('rw', 'blocksize', 'iodepth', 'concurrency')
+
+# bytes per suffix, fio treats a plain number as bytes
+SIZE_SUFFIXES = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def size_kb(value):
+    "parses fio-style size ('4096', '4k', '1m'), returns KiB"
+    value = value.strip().lower()
+    if value.endswith('b'):
+        value = value[:-1]
+    suffix = value[-1:] if value[-1:] in SIZE_SUFFIXES else ''
+    try:
+        size = int(value[:len(value) - len(suffix)]) * SIZE_SUFFIXES[suffix]
+    except ValueError:
+        raise ValueError("Unknown size format {0!r}".format(value))
+
+    if size % 1024:
+        raise ValueError("Size {0!r} isn't a whole number of KiB"
+                         .format(value))
+    return size // 1024
+
+
+def parse_bssplit(value):
+    """Parses fio bssplit value ('4k/60:64k/40')
+
+    :returns: [(blocksize in KiB, percent)]
+    """
+    res = []
+    for item in value.split(':'):
+        bsize, _, percent = item.partition('/')
+        res.append((size_kb(bsize),
+                    int(percent) if percent else 0))
+    return res
+
+
+def load_workloads(path):
+    """Reads workload profiles from INI file
+
+    Every section is a named workload, e.g.::
+
+        [oltp]
+        rw = randrw
+        rwmixread = 70
+        bssplit = 8k/70:16k/20:64k/10
+        random_distribution = zipf:1.2
+        fsync = 32
+
+    :returns: [(name, {key: value})] in file order
+    """
+    config = ConfigParser.RawConfigParser()
+    if not config.read(path):
+        raise ValueError("Can't read workload file {0!r}".format(path))
+
+    workloads = []
+    for name in config.sections():
+        options = dict(config.items(name))
+        unknown = set(options) - set(FIO_WORKLOAD_KEYS + BENCHMARK_KEYS)
+        if unknown:
+            raise ValueError("Unknown option(s) {0} of workload {1!r}".format(
+                ", ".join(sorted(unknown)), name))
+
+        if options.get('rw') not in WORKLOAD_RW:
+            raise ValueError("Workload {0!r} should set rw to one of {1}"
+                             .format(name, ", ".join(WORKLOAD_RW)))
+
+        if 'blocksize' not in options and 'bssplit' not in options:
+            raise ValueError("Workload {0!r} needs blocksize or bssplit"
+                             .format(name))
+
+        workloads.append((name, options))
+    return workloads
+
+
+def workload_blocksize(options):
+    "blocksize to label results with, the most frequent one for bssplit"
+    if 'blocksize' in options:
+        return size_kb(options['blocksize'])
+    return max(parse_bssplit(options['bssplit']), key=lambda x: x[1])[0]
+
+
+def workload_benchmarks(workloads, concurrencies, iodepths, size):
+    """Makes benchmarks of workloads
+
+    Workload, which doesn't set iodepth or concurrency, is run with every
+    given value of them.
+    """
+    benchmarks = []
+    for name, options in workloads:
+        blocksize = workload_blocksize(options)
+        wl_concurrencies = concurrencies
+        if 'concurrency' in options:
+            wl_concurrencies = [int(options['concurrency'])]
+
+        wl_iodepths = iodepths
+        if 'iodepth' in options:
+            wl_iodepths = [int(options['iodepth'])]
+
+        for concurence in wl_concurrencies:
+            for iodepth in wl_iodepths:
+                bench = BenchmarkOption(concurence, iodepth, options['rw'],
+                                        blocksize, size)
+                bench.workload = name
+                bench.workload_options = [
+                    "{0}={1}".format(key, options[key])
+                    for key in FIO_WORKLOAD_KEYS if key in options]
+                benchmarks.append(bench)
+    return benchmarks